@@ -0,0 +1,2 @@
+# -*- coding: utf-8 -*-
+"""Benchmarks of HtmlNode, which are not shipped with the package."""
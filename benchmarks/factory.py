@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+"""Measure the time to import HtmlNode and to look up elements in the factory.
+
+Run with ``python -m benchmarks.factory``.
+"""
+import subprocess
+import sys
+import timeit
+from html_node import html_node as h
+
+
+def import_time(module='html_node', repeat=10):
+    """Return the best time in seconds to import a module in a new interpreter, less the
+    time to start the interpreter."""
+    def best(statement):
+        return min(timeit.repeat(lambda: subprocess.check_call([sys.executable, '-c', statement]),
+                                 number=1, repeat=repeat))
+    return best('import ' + module) - best('pass')
+
+
+def lookup_time(name='div', number=1000000):
+    """Return the time in seconds of one lookup of an element in the factory."""
+    getattr(h, name)
+    return min(timeit.repeat(lambda: getattr(h, name), number=number, repeat=3)) / number
+
+
+def main():
+    print 'import html_node:   {:>8.2f} ms'.format(import_time() * 1000)
+    print 'lookup of h.div:    {:>8.0f} ns'.format(lookup_time('div') * 1e9)
+    print 'lookup of h.custom: {:>8.0f} ns'.format(lookup_time('custom') * 1e9)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""Compare the memory footprint of wide tables with the former dict-based tags.
+
+Run with ``python -m benchmarks.memory [rows] [columns]``.
+"""
+import gc
+import sys
+import types
+from html_node import html_node as h
+
+
+class LegacyTag(object):
+    """Mimic the per-instance state of tags before they used slots."""
+    tagname = None
+    default_attributes = {}
+
+    def __init__(self, tagname, *args):
+        self.tagname = tagname
+        self.children = []
+        self.children.extend(list(args))
+        self.attributes = self.default_attributes.copy()
+        self._classes = None
+
+
+def deep_sizeof(root):
+    """Sum the size of all objects reachable from the root, classes and modules excluded."""
+    seen = set()
+    stack = [root]
+    total = 0
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen or isinstance(obj, (type, types.ModuleType, types.FunctionType)):
+            continue
+        seen.add(id(obj))
+        total += sys.getsizeof(obj)
+        stack.extend(gc.get_referents(obj))
+    return total
+
+
+def legacy_table(rows, columns):
+    return LegacyTag('table', *[LegacyTag('tr', *[LegacyTag('td', u'cell') for _ in xrange(columns)])
+                                for _ in xrange(rows)])
+
+
+def table(rows, columns):
+    return h.table(*[h.tr(*[h.td(u'cell') for _ in xrange(columns)]) for _ in xrange(rows)])
+
+
+def measure(rows=1000, columns=100):
+    """Return the footprint in bytes of a wide table, as ``(legacy, current)``."""
+    return deep_sizeof(legacy_table(rows, columns)), deep_sizeof(table(rows, columns))
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    rows, columns = [int(arg) for arg in argv] if argv else (1000, 100)
+    legacy, current = measure(rows, columns)
+    cells = rows * columns
+    print 'Table of {} x {} cells'.format(rows, columns)
+    print '  legacy:  {:>12,} bytes ({:.1f} per cell)'.format(legacy, float(legacy) / cells)
+    print '  current: {:>12,} bytes ({:.1f} per cell)'.format(current, float(current) / cells)
+    print '  saving:  {:.1%}'.format(1 - float(current) / legacy)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""Run the benchmarks and compare them against a saved baseline.
+
+Run with ``python -m benchmarks [--save FILE] [--compare FILE] [names...]``.
+"""
+import argparse
+import json
+import sys
+import timeit
+from .memory import deep_sizeof
+from .suite import BENCHMARKS
+
+
+def measure(operation, repeat=3, min_time=0.2):
+    """Return the operations per second of the best run, and the size of its result."""
+    number = 1
+    while True:
+        elapsed = timeit.timeit(operation, number=number)
+        if elapsed >= min_time:
+            break
+        number *= 2
+    best = min([elapsed] + timeit.repeat(operation, number=number, repeat=repeat - 1))
+    return number / best, deep_sizeof(operation())
+
+
+def run(names=None, repeat=3):
+    """Run the benchmarks, and yield their names along with their results."""
+    for name, factory in BENCHMARKS.items():
+        if names and name not in names:
+            continue
+        ops, size = measure(factory(), repeat=repeat)
+        yield name, {'ops': ops, 'bytes': size}
+
+
+def compare(result, baseline):
+    """Return the relative change of speed of a result against its baseline."""
+    return result['ops'] / baseline['ops'] - 1
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description=__doc__.splitlines()[0])
+    parser.add_argument('names', nargs='*', help='benchmarks to run, all of them by default')
+    parser.add_argument('--save', metavar='FILE', help='save the results as a baseline')
+    parser.add_argument('--compare', metavar='FILE', help='compare the results with a baseline')
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help='slowdown allowed before reporting a regression (default: 0.1)')
+    parser.add_argument('--repeat', type=int, default=3, help='number of timed runs (default: 3)')
+    args = parser.parse_args(argv)
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as fp:
+            baseline = json.load(fp)
+
+    results = {}
+    regressions = []
+    for name, result in run(args.names, repeat=args.repeat):
+        results[name] = result
+        line = '{:<28}{:>14,.1f} ops/s{:>14,} bytes'.format(name, result['ops'], result['bytes'])
+        if name in baseline:
+            change = compare(result, baseline[name])
+            line += '{:>+10.1%}'.format(change)
+            if change < -args.tolerance:
+                regressions.append(name)
+                line += '  REGRESSION'
+        print line
+        sys.stdout.flush()
+
+    if args.save:
+        with open(args.save, 'w') as fp:
+            json.dump(results, fp, indent=2, sort_keys=True)
+    if regressions:
+        print '{} regression(s): {}'.format(len(regressions), ', '.join(regressions))
+        return 1
+    return 0
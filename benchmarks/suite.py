@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""Benchmarks of the hot paths of HtmlNode.
+
+Each benchmark prepares its input and returns the operation to measure, which takes
+no argument and returns what it has built or rendered.
+"""
+from collections import OrderedDict
+from html_node import html_node as h, BaseLayout, Tracker, placeholder
+from html_node.utils import escape
+from .memory import table
+
+
+BENCHMARKS = OrderedDict()
+
+
+def benchmark(func):
+    """Register a benchmark under the name of its function."""
+    BENCHMARKS[func.__name__] = func
+    return func
+
+
+@benchmark
+def construct_table():
+    """Build a 100 x 10 table through the factory."""
+    return lambda: table(100, 10)
+
+
+@benchmark
+def construct_table_fast():
+    """Build the same table through the fast constructor."""
+    table, tr, td = h.table, h.tr, h.td
+    return lambda: table._fast([tr._fast([td._fast(u'cell') for _ in xrange(10)]) for _ in xrange(100)])
+
+
+@benchmark
+def construct_list_items():
+    """Build 1000 list items with classes and data attributes through the factory."""
+    return lambda: h.ul()([h.li(u'item', class_='item odd', data_id=i) for i in xrange(1000)])
+
+
+@benchmark
+def construct_list_items_fast():
+    """Build the same list items through the fast constructor."""
+    ul, li = h.ul, h.li
+    return lambda: ul._fast([li._fast(u'item', {'class': 'item odd', 'data-id': i}) for i in xrange(1000)])
+
+
+@benchmark
+def factory_lookup():
+    """Look up 100 standard and custom elements in the factory."""
+    names = ['div', 'span', 'td', 'tr', 'custom_name'] * 20
+    return lambda: [getattr(h, name) for name in names]
+
+
+@benchmark
+def render_wide_table():
+    """Render a 200 x 20 table with attributes on some cells."""
+    tag = h.table(*[h.tr(*[h.td(u'cell', class_='c') if j % 3 == 0 else h.td(u'x < y')
+                          for j in xrange(20)], data_row=i) for i in xrange(200)])
+    return tag.render
+
+
+@benchmark
+def render_table_from_rows():
+    """Render a 200 x 20 table from rows of bulk data."""
+    rows = [[u'cell' if j % 3 == 0 else u'x < y' for j in xrange(20)] for i in xrange(200)]
+    return lambda: h.table.from_rows(rows).render()
+
+
+@benchmark
+def render_deep_nesting():
+    """Render 2000 nested divs."""
+    root = leaf = h.div()
+    for i in xrange(2000):
+        child = h.div(i, class_='level')
+        leaf.append(child)
+        leaf = child
+    return root.render
+
+
+@benchmark
+def render_text_heavy():
+    """Render 500 paragraphs of plain and escaped text."""
+    plain = u'Lorem ipsum dolor sit amet, consectetur adipiscing elit. ' * 10
+    special = u'Fish & chips <cheap> "today" only. ' * 10
+    tag = h.article(*[h.p(plain if i % 2 else special) for i in xrange(500)])
+    return tag.render
+
+
+@benchmark
+def rerender_tracked_change():
+    """Change one cell of a tracked 200 x 20 table and get the changed fragment."""
+    tag = h.table(*[h.tr(*[h.td(u'cell') for j in xrange(20)]) for i in xrange(200)])
+    tracker = Tracker(tag)
+    tracker.render()
+    cell = tag.children[100].children[10].children
+
+    def change():
+        cell[0] = u'x' if cell[0] == u'cell' else u'cell'
+        return tracker.changes()
+    return change
+
+
+class _Dashboard(BaseLayout):
+    def template(self):
+        return h.html5(h.head(placeholder('head')), h.body(placeholder('nav'), placeholder('body')))
+
+    @placeholder
+    def nav(self):
+        return h.nav(h.ul()([h.li(h.a(item, href='/' + item)) for item in self.c('items')]))
+
+    @placeholder
+    def body(self):
+        return h.div(class_='container')([h.p(u'Row %d' % i) for i in xrange(50)])
+
+
+class _CompiledDashboard(_Dashboard):
+    compiled = True
+
+
+@benchmark
+def render_template():
+    """Render a layout with three placeholders."""
+    items = ['home', 'about', 'blog', 'contact']
+    return lambda: _Dashboard(items=items).render()
+
+
+@benchmark
+def render_compiled_template():
+    """Render the same layout compiled."""
+    items = ['home', 'about', 'blog', 'contact']
+    return lambda: _CompiledDashboard(items=items).render()
+
+
+@benchmark
+def escape_text():
+    """Escape 1000 strings, half of them without special characters."""
+    texts = [u'plain text number %d' % i if i % 2 else u'<b>%d</b> & more' % i for i in xrange(1000)]
+    return lambda: [escape(text) for text in texts]
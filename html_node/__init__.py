@@ -1,10 +1,18 @@
 # -*- coding: utf-8 -*-
 """A simple library to handle HTML tags and templates."""
-from .tags import TagSingletonError, Node, html_node
-from .templates import Placeholder, BaseTemplate, BaseLayout, Tag, placeholder
+__version__ = '0.1.8'
+
+from .tags import TagSingletonError, TagFrozenError, Node, html_node
+from .fragments import FileFragment
+from .parallel import render_parallel
+from .profiling import RenderProfile
+from .templates import CompiledContextError, Placeholder, ContextValue, FragmentCache, BaseTemplate, BaseLayout, Tag, \
+    placeholder
+from .tracking import TagTrackedError, Tracker, Index
+from .utils import Markup
 
 __all__ = [
-    'TagSingletonError', 'Node',
-    'Placeholder', 'BaseTemplate', 'BaseLayout', 'Tag', 'placeholder',
-    'html_node'
+    'TagSingletonError', 'TagFrozenError', 'TagTrackedError', 'CompiledContextError', 'Node',
+    'Placeholder', 'ContextValue', 'FragmentCache', 'BaseTemplate', 'BaseLayout', 'Tag', 'placeholder',
+    'Markup', 'FileFragment', 'RenderProfile', 'render_parallel', 'Tracker', 'Index', 'html_node'
 ]
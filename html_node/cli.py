@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""Render a template for every context of a JSON lines stream into files.
+
+Run with ``html-node-render package.module:Template contexts.jsonl -o site/``.
+"""
+import argparse
+import importlib
+import io
+import json
+import math
+import multiprocessing
+import os
+import sys
+from timeit import default_timer
+from .utils import BUFFER_SIZE
+
+
+__all__ = ['render_pages', 'main']
+
+# Template class and options of the worker processes, set by `_init_worker`
+_worker = {}
+
+
+def import_template(path):
+    """Import a template class from ``package.module:Class`` or ``package.module.Class``."""
+    module, _, name = path.rpartition(':') if ':' in path else path.rpartition('.')
+    return getattr(importlib.import_module(module), name)
+
+
+def read_contexts(fp):
+    """Yield the contexts of a JSON lines stream, skipping blank lines."""
+    for line in fp:
+        if line.strip():
+            yield json.loads(line)
+
+
+def _init_worker(template, output_dir, path, encoding, buffer_size):
+    _worker.update(template=import_template(template) if isinstance(template, basestring) else template,
+                   output_dir=output_dir, path=path, encoding=encoding, buffer_size=buffer_size)
+
+
+def _render_page(task):
+    """Render a page into its file, and return its path, size in bytes and latency in seconds."""
+    index, context = task
+    start = default_timer()
+    path = os.path.join(_worker['output_dir'], _worker['path'].format(index=index, **context))
+    directory = os.path.dirname(path)
+    if directory and not os.path.isdir(directory):
+        try:
+            os.makedirs(directory)
+        except OSError:
+            if not os.path.isdir(directory):
+                raise
+    with io.open(path, 'wb', buffering=_worker['buffer_size']) as fp:
+        size = _worker['template'](context).render_to(fp, encoding=_worker['encoding'],
+                                                      buffer_size=_worker['buffer_size'])
+    return path, size, default_timer() - start
+
+
+def render_pages(template, contexts, output_dir='.', path='{index}.html', processes=None, chunk_size=64,
+                 encoding='utf-8', buffer_size=BUFFER_SIZE):
+    """Render a template for every context into a file, across a process pool.
+
+    The contexts are sent to the workers in chunks, and every worker writes the pages it
+    renders into their files itself, so that no HTML goes back to the main process.
+
+    :param template: A template class, or its import path
+    :param contexts: An iterable of context dictionaries
+    :param path: Format of the path of a page in ``output_dir``, given the context and
+        the ``index`` of the page
+    :param processes: Number of worker processes, the number of CPUs by default
+    :param chunk_size: Number of pages sent to a worker at once
+    :return: The list of ``(path, bytes, seconds)`` of the pages, in the order they were
+        rendered
+    """
+    pool = multiprocessing.Pool(processes, _init_worker, (template, output_dir, path, encoding, buffer_size))
+    try:
+        return list(pool.imap_unordered(_render_page, enumerate(contexts), chunksize=chunk_size))
+    finally:
+        pool.close()
+        pool.join()
+
+
+def percentile(values, fraction):
+    """Get a percentile of sorted values by the nearest rank."""
+    return values[max(0, int(math.ceil(len(values) * fraction)) - 1)]
+
+
+def report(results, elapsed, stream=None):
+    """Write the throughput and the latency percentiles of rendered pages."""
+    stream = stream or sys.stderr
+    latencies = sorted(seconds for _, _, seconds in results)
+    size = sum(size for _, size, _ in results)
+    stream.write('{:,} pages, {:,} bytes in {:.2f} s: {:,.1f} pages/s, {:,.1f} MB/s\n'.format(
+        len(results), size, elapsed, len(results) / elapsed, size / elapsed / 1e6))
+    if latencies:
+        stream.write('latency: {}\n'.format(', '.join(
+            '{} {:.2f} ms'.format(name, percentile(latencies, fraction) * 1000)
+            for name, fraction in (('p50', 0.5), ('p90', 0.9), ('p99', 0.99), ('max', 1.0)))))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='html-node-render', description=__doc__.splitlines()[0])
+    parser.add_argument('template', help='import path of the template class, e.g. package.module:Template')
+    parser.add_argument('contexts', nargs='?', default='-',
+                        help='JSON lines file of the contexts, the standard input by default')
+    parser.add_argument('-o', '--output-dir', default='.', help='directory of the pages (default: .)')
+    parser.add_argument('-p', '--path', default='{index}.html',
+                        help='format of the path of a page, given its context and index (default: {index}.html)')
+    parser.add_argument('-j', '--processes', type=int, help='number of worker processes (default: number of CPUs)')
+    parser.add_argument('--chunk-size', type=int, default=64,
+                        help='number of pages sent to a worker at once (default: 64)')
+    parser.add_argument('--encoding', default='utf-8', help='encoding of the pages (default: utf-8)')
+    args = parser.parse_args(argv)
+
+    import_template(args.template)
+    fp = sys.stdin if args.contexts == '-' else open(args.contexts)
+    try:
+        start = default_timer()
+        results = render_pages(args.template, read_contexts(fp), output_dir=args.output_dir, path=args.path,
+                               processes=args.processes, chunk_size=args.chunk_size, encoding=args.encoding)
+        report(results, default_timer() - start)
+    finally:
+        if fp is not sys.stdin:
+            fp.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+import codecs
+import mmap
+import os
+import thread
+from collections import OrderedDict
+from .tags import Node
+from .utils import Markup
+
+
+__all__ = ['FileFragment']
+
+# Maximum number of loaded files kept. The mapping of an evicted file is closed once
+# no markup read from it is used any more
+MAX_FILES = 64
+# Loaded files by path, as (modification time, size, markup), least recently used first
+_files = OrderedDict()
+_files_lock = thread.allocate_lock()
+
+
+class _FileMarkup(Markup):
+    """Markup decoded from a file, which keeps a buffer of the memory-mapped file."""
+    __slots__ = ('encoded', 'encoding')
+
+
+def _load(path, encoding):
+    """Get the markup of a file, reading it again only if it was modified since."""
+    stat = os.stat(path)
+    with _files_lock:
+        entry = _files.pop(path, None)
+        if entry is not None and entry[0] == stat.st_mtime and entry[1] == stat.st_size \
+                and entry[2].encoding == encoding:
+            _files[path] = entry
+            return entry[2]
+
+    with open(path, 'rb') as fp:
+        if stat.st_size:
+            encoded = buffer(mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ))
+        else:
+            encoded = buffer(b'')
+    markup = _FileMarkup(encoded, encoding)
+    markup.encoded = encoded
+    markup.encoding = encoding
+    with _files_lock:
+        _files.pop(path, None)
+        _files[path] = (stat.st_mtime, stat.st_size, markup)
+        while len(_files) > MAX_FILES:
+            _files.popitem(last=False)
+    return markup
+
+
+class FileFragment(Node):
+    """HTML read from a file, which is inserted as it is without being escaped.
+
+    The file is memory-mapped and decoded only once until it is modified, and is shared
+    by all the fragments of the same path. The ``MAX_FILES`` most recently used files
+    are kept loaded. ``render_to`` writes the bytes of the file
+    directly if the output is in the same encoding.
+    """
+    def __init__(self, path, encoding='utf-8'):
+        """
+        :param path: Path of the file
+        :param encoding: Encoding of the file
+        """
+        self.path = os.path.abspath(path)
+        self.encoding = codecs.lookup(encoding).name
+
+    def __html__(self):
+        return _load(self.path, self.encoding)
+
+    def iter_render(self):
+        yield _load(self.path, self.encoding)
+
+    def __unicode__(self):
+        return _load(self.path, self.encoding)
+
+    def __str__(self):
+        return self.__unicode__()
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+import os
+import thread
+from collections import Iterator
+from .tags import Tag, _NATIVE, _render_mode, _serialize
+
+
+__all__ = ['render_parallel']
+
+# Minimum number of siblings for them to be serialized in the process pool
+THRESHOLD = 2000
+
+# Tags whose children are being serialized in the process pool, which the workers
+# inherit when they are forked, so that the tree is never pickled
+_large = []
+_large_lock = thread.allocate_lock()
+
+
+def _render_chunk(task):
+    index, start, end = task
+    node = _large[index]
+    return u''.join(_serialize(node.children[start:end], safe=node._safe, delimiter=node._delimiter))
+
+
+def _large_tags(tag, threshold):
+    """Find the tags with at least ``threshold`` children, not looking into them.
+
+    Lists having iterators among them are left to be rendered serially, as each iterator
+    is consumed by the first render.
+    """
+    found = []
+    stack = [tag]
+    while stack:
+        node = stack.pop()
+        if node._html is not None or (node is not tag and _render_mode(type(node)) != _NATIVE):
+            continue
+        if isinstance(node.children, (list, tuple)) and len(node.children) >= threshold and \
+                not any(isinstance(child, Iterator) for child in node.children):
+            found.append(node)
+        else:
+            stack.extend(child for child in node.children if isinstance(child, Tag))
+    return found
+
+
+def render_parallel(tag, processes=None, threshold=THRESHOLD):
+    """Render a large tag, serializing its large lists of siblings in a process pool.
+
+    Lists of at least ``threshold`` siblings, e.g. the rows of a table body, are
+    split into chunks which are serialized in parallel, and concatenated in order.
+    The pool is forked for the render, so the workers inherit the tree and are only
+    sent the span of each chunk. The tag is rendered serially if it has no such list,
+    or if processes cannot be forked.
+
+    :param processes: Number of worker processes, the number of CPUs by default
+    :param threshold: Minimum number of siblings to serialize in parallel
+    """
+    large = _large_tags(tag, threshold)
+    if not large or not hasattr(os, 'fork'):
+        return tag.render()
+
+    import multiprocessing
+    workers = processes or multiprocessing.cpu_count()
+    tasks, spans = [], []
+    for number, node in enumerate(large):
+        size = max(1, -(-len(node.children) // (workers * 4)))
+        start = len(tasks)
+        for index in xrange(0, len(node.children), size):
+            tasks.append((number, index, index + size))
+        spans.append((node, start, len(tasks)))
+
+    with _large_lock:
+        _large[:] = large
+        try:
+            pool = multiprocessing.Pool(processes)
+            try:
+                results = pool.map(_render_chunk, tasks)
+            finally:
+                pool.close()
+                pool.join()
+        finally:
+            del _large[:]
+
+    rendered = {}
+    for node, start, end in spans:
+        inner = node._delimiter.join(results[start:end])
+        rendered[id(node)] = u''.join([node.doctype or u'', node._open_tag(), inner, node._close_tag()])
+    return u''.join(_serialize((tag,), native=tag, rendered=rendered))
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+from collections import defaultdict
+from timeit import default_timer
+
+
+__all__ = ['RenderStats', 'RenderProfile']
+
+
+class RenderStats(object):
+    """Number of calls, total time in seconds and output size in characters."""
+    __slots__ = ('count', 'time', 'size')
+
+    def __init__(self):
+        self.count = 0
+        self.time = 0.0
+        self.size = 0
+
+    def add(self, time, size=0):
+        self.count += 1
+        self.time += time
+        self.size += size
+
+    def as_dict(self):
+        return {'count': self.count, 'time': self.time, 'size': self.size}
+
+    def __repr__(self):
+        return '<RenderStats count={} time={:.6f} size={}>'.format(self.count, self.time, self.size)
+
+
+class RenderProfile(object):
+    """Instrumentation of renders, which is opted in by ``render(profile=...)``.
+
+    It can be passed to several renders to accumulate their numbers.
+
+    - ``nodes``: number of nodes serialized, including text
+    - ``tags``: stats by tagname, the time and size include the descendents
+    - ``placeholders``: stats by placeholder name, the time of evaluating them
+    - ``phases``: stats of the phases of rendering a template, which are ``template``
+      for building its tree and ``serialize``, the latter including the placeholders
+    """
+    def __init__(self):
+        self.nodes = 0
+        self.tags = defaultdict(RenderStats)
+        self.placeholders = defaultdict(RenderStats)
+        self.phases = defaultdict(RenderStats)
+
+    def as_dict(self):
+        """Export the numbers as plain dictionaries, e.g. for a metrics pipeline."""
+        return {
+            'nodes': self.nodes,
+            'tags': dict((key, stats.as_dict()) for key, stats in self.tags.items()),
+            'placeholders': dict((key, stats.as_dict()) for key, stats in self.placeholders.items()),
+            'phases': dict((key, stats.as_dict()) for key, stats in self.phases.items()),
+        }
+
+
+class _Measure(object):
+    __slots__ = ('stats', 'start')
+
+    def __init__(self, stats):
+        self.stats = stats
+
+    def __enter__(self):
+        self.start = default_timer()
+
+    def __exit__(self, *exc_info):
+        self.stats.add(default_timer() - self.start)
+
+
+class _Nothing(object):
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc_info):
+        pass
+
+_nothing = _Nothing()
+
+
+def measure(profile, group, name):
+    """Context manager adding the time of its block to the stats ``name`` of a group of
+    the profile, which does nothing if there is no profile."""
+    if profile is None:
+        return _nothing
+    return _Measure(getattr(profile, group)[name])
+
+
+def measure_chunks(profile, group, name, chunks):
+    """Add the time spent producing the chunks and their size to the stats ``name`` of a
+    group of the profile, or return the chunks as they are if there is no profile."""
+    if profile is None:
+        return chunks
+    return _measure_chunks(getattr(profile, group)[name], iter(chunks))
+
+
+def _measure_chunks(stats, chunks):
+    elapsed, size = 0.0, 0
+    while True:
+        start = default_timer()
+        try:
+            chunk = next(chunks)
+        except StopIteration:
+            break
+        finally:
+            elapsed += default_timer() - start
+        size += len(chunk)
+        yield chunk
+    stats.add(elapsed, size)
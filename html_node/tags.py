@@ -1,11 +1,11 @@
 # -*- coding: utf-8 -*-
-import copy
-from cgi import escape
-from .utils import TAG_TYPE_OPEN, TAG_TYPE_CLOSE, TAG_TYPE_SINGLETON
-from .utils import render_tag, html_params
+import itertools
+from collections import Iterator
+from timeit import default_timer
+from .utils import BUFFER_SIZE, Markup, escape, html_params, write_encoded
 
 
-__all__ = ['TagSingletonError', 'Node', 'Tag', 'html_node']
+__all__ = ['TagSingletonError', 'TagFrozenError', 'Node', 'Tag', 'html_node']
 
 
 class TagSingletonError(Exception):
@@ -13,59 +13,386 @@ class TagSingletonError(Exception):
     pass
 
 
+class TagFrozenError(Exception):
+    """Raised when a frozen tag is modified."""
+    pass
+
+
+class _FrozenDict(dict):
+    """Attributes of a frozen tag, which cannot be changed any more."""
+    def _frozen(self, *args, **kwargs):
+        raise TagFrozenError
+
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = update = _frozen
+
+    def __reduce__(self):
+        return _FrozenDict, (dict(self),)
+
+
 class Node(object):
     """Base type for all node objects."""
-    pass
+    __slots__ = ()
+
+
+# Number of pieces collected in the output buffer before a chunk is yielded
+CHUNK_SIZE = 256
+
+_NATIVE, _CUSTOM_STREAM, _CUSTOM_UNICODE = 0, 1, 2
+_render_modes = {}
+
+
+def _render_mode(cls):
+    """Tell how the render engine should serialize instances of a Tag class.
+
+    Subclasses overriding ``iter_render`` or ``__unicode__`` are delegated to, so that
+    their customised output is kept."""
+    try:
+        return _render_modes[cls]
+    except KeyError:
+        if cls.iter_render.im_func is not Tag.iter_render.im_func:
+            mode = _CUSTOM_STREAM
+        elif cls.__unicode__.im_func is not Tag.__unicode__.im_func:
+            mode = _CUSTOM_UNICODE
+        else:
+            mode = _NATIVE
+        _render_modes[cls] = mode
+        return mode
+
+
+_attribute_names = {}
+_class_markups = {}
+# Class attributes the markups of a Tag class are computed from
+_markup_attributes = frozenset(['tagname', 'singleton', 'default_attributes', 'default_classes'])
+
+
+def _attribute_name(key):
+    """Turn a keyword argument into an attribute name, e.g. ``data_id`` into ``data-id``."""
+    try:
+        return _attribute_names[key]
+    except KeyError:
+        name = key[:-1] if key.endswith('_') else key
+        name = _attribute_names[key] = name.replace('_', '-')
+        return name
+
+
+def _markups(cls):
+    """Get the precomputed markups of a Tag class.
+
+    These are the start and end of its opening tag, its closing tag, and its whole
+    opening tag for instances without attributes or classes of their own. They are
+    computed again when one of the class attributes they depend on is set.
+    """
+    try:
+        return _class_markups[cls]
+    except KeyError:
+        start, end = u'<' + cls.tagname, u' />' if cls.singleton else u'>'
+        attributes = dict(cls.default_attributes)
+        if cls.default_classes:
+            attributes['class'] = ' '.join(cls.default_classes)
+        partial = html_params(attributes)
+        default = start + u' ' + partial + end if partial.strip() else start + end
+        markups = _class_markups[cls] = (start, end, u'</' + cls.tagname + u'>', default)
+        return markups
+
+
+def _serialize(children, safe=False, delimiter=u'', chunk_size=None, slots=(), native=None, profile=None,
+               rendered=None, scope=None):
+    """Serialize nodes depth-first using an explicit stack instead of recursion.
+
+    All markup is written into a single shared buffer, which is yielded as one chunk
+    whenever it holds ``chunk_size`` pieces, or only once at the end if not given.
+    When streaming, chunks of nodes which render themselves are passed on as they come,
+    and those of a subclass of unicode, such as markup read from a file, as they are.
+    Nodes that are instances of ``slots`` are not rendered but yielded as a
+    ``(node, safe)`` pair in place. The ``native`` tag is always serialized by the
+    engine, even if its class customises rendering. Tags are instrumented in the
+    :class:`~html_node.profiling.RenderProfile` if one is given. ``rendered`` maps
+    the ids of tags to their HTML if it was rendered beforehand. Nodes having a
+    ``bind`` method, such as placeholders, are replaced by what they are bound to in
+    the ``scope`` mapping when it is given, without modifying the tree. Children which
+    are iterators, such as generators, are consumed in place while serializing.
+    Every stack frame is ``[children iterator, safe, delimiter, close tag, first,
+    opened]``, where ``opened`` is the tagname, start time and output size when
+    the tag was opened if it is profiled.
+    """
+    buf = []
+    if profile is None:
+        write = buf.append
+    else:
+        written = [0]
+        append = buf.append
+
+        def write(piece):
+            written[0] += len(piece)
+            append(piece)
+
+    stack = [[iter(children), safe, delimiter, None, True, None]]
+    while stack:
+        frame = stack[-1]
+        children, safe, delimiter = frame[0], frame[1], frame[2]
+        for child in children:
+            if chunk_size and len(buf) >= chunk_size:
+                yield u''.join(buf)
+                del buf[:]
+            if frame[4]:
+                frame[4] = False
+            elif delimiter:
+                if type(child) is not unicode and isinstance(child, Iterator):
+                    # Its first child writes the delimiter, if it has any
+                    frame[0] = itertools.chain(child, children)
+                    break
+                write(delimiter)
+            if profile is not None:
+                profile.nodes += 1
+
+            if isinstance(child, Tag):
+                opened = None
+                if profile is not None:
+                    opened = (child.tagname, default_timer(), written[0])
+                html = child._html if rendered is None else rendered.get(id(child), child._html)
+                if html is not None:
+                    write(html)
+                else:
+                    mode = _NATIVE if child is native else _render_mode(type(child))
+                    if mode == _NATIVE:
+                        if child.doctype:
+                            write(child.doctype)
+                        write(child._open_tag())
+                        if not child.singleton:
+                            stack.append([iter(child.children), child._safe, child._delimiter,
+                                          child._close_tag(), True, opened])
+                            break
+                    elif mode == _CUSTOM_STREAM:
+                        for chunk in child.iter_render():
+                            if chunk_size and buf and type(chunk) is not unicode:
+                                yield u''.join(buf)
+                                del buf[:]
+                            write(chunk)
+                            if chunk_size:
+                                yield chunk if len(buf) == 1 else u''.join(buf)
+                                del buf[:]
+                    else:
+                        write(unicode(child))
+                if opened is not None:
+                    profile.tags[opened[0]].add(default_timer() - opened[1], written[0] - opened[2])
+            elif isinstance(child, Node):
+                if slots and isinstance(child, slots):
+                    if buf:
+                        yield u''.join(buf)
+                        del buf[:]
+                    yield child, safe
+                elif scope is not None and hasattr(child, 'bind'):
+                    stack.append([iter((child.bind(scope),)), safe, u'', None, True, None])
+                    break
+                elif hasattr(child, 'iter_render'):
+                    for chunk in child.iter_render():
+                        if chunk_size and buf and type(chunk) is not unicode:
+                            yield u''.join(buf)
+                            del buf[:]
+                        write(chunk)
+                        if chunk_size:
+                            yield chunk if len(buf) == 1 else u''.join(buf)
+                            del buf[:]
+                else:
+                    write(unicode(child))
+            elif safe and not isinstance(child, Iterator):
+                write(unicode(child))
+            else:
+                cls = type(child)
+                if cls is unicode or cls is str:
+                    write(escape(unicode(child)))
+                elif cls is Markup:
+                    write(child)
+                elif hasattr(child, '__html__'):
+                    write(child.__html__())
+                elif isinstance(child, Iterator):
+                    # Pull the children of an iterator in place, only as they are rendered
+                    frame[0] = itertools.chain(child, children)
+                    frame[4] = True
+                    break
+                else:
+                    write(escape(unicode(child)))
+        else:
+            stack.pop()
+            if frame[3] is not None:
+                write(frame[3])
+            if frame[5] is not None:
+                name, start, size = frame[5]
+                profile.tags[name].add(default_timer() - start, written[0] - size)
+    if buf:
+        yield u''.join(buf)
+
+
+class TagMeta(type):
+    """Prepare a Tag class for its compact, slot-based instances.
+
+    The tagname is resolved once from the class name unless it is given explicitly,
+    and the class-level ``safe`` and ``children_delimiter`` are kept as defaults for
+    the slots which an instance may override, whether they are given in the class
+    body or set on the class afterwards.
+    """
+    def __new__(mcs, name, bases, attrs):
+        for key in ('safe', 'children_delimiter'):
+            if key in attrs and not isinstance(attrs[key], property):
+                attrs['_default_' + key] = attrs.pop(key)
+        return super(TagMeta, mcs).__new__(mcs, name, bases, attrs)
+
+    def __setattr__(cls, key, value):
+        if key in ('safe', 'children_delimiter') and not isinstance(value, property):
+            key = '_default_' + key
+        super(TagMeta, cls).__setattr__(key, value)
+        if key in _markup_attributes and (cls in _class_markups or cls.__subclasses__()):
+            # Subclasses may inherit the attribute, so all the markups are computed again
+            _class_markups.clear()
+
+    def __init__(cls, name, bases, attrs):
+        super(TagMeta, cls).__init__(name, bases, attrs)
+        if attrs.get('tagname') is not None:
+            cls._auto_tagname = False
+        elif 'tagname' in attrs or cls.tagname is None or cls._auto_tagname:
+            cls.tagname = name.lower()
+            cls._auto_tagname = True
 
 
 class Tag(Node):
+    __metaclass__ = TagMeta
+    __slots__ = ('children', '_attributes', '_classes', '_safe', '_delimiter', '_frozen', '_html', '_tracker',
+                 'name')
     tagname = None
     default_attributes = {}
     default_classes = []
     required_attributes = []
     singleton = False
-    children_delimiter = u''
-    safe = False
+    doctype = None
+    _default_safe = False
+    _default_children_delimiter = u''
 
     def __init__(self, *args, **kwargs):
-        # Guess tagname if not provided
-        if self.tagname is None:
-            self.tagname = self.__class__.__name__.lower()
-
         # Append children if not singleton
-        self.children = []
-        self.children.extend(list(args))
-        self.children.extend(kwargs.get('children', []))
+        self.children = list(args)
         if 'children' in kwargs:
-            del kwargs['children']
-        if len(self.children) > 0 and self.singleton:
+            children = kwargs.pop('children')
+            if isinstance(children, Iterator):
+                # Keep iterators lazy, they are consumed when the tag is rendered
+                self.children.append(children)
+            else:
+                self.children.extend(children)
+        if self.children and self.singleton:
             raise TagSingletonError
 
-        # Assigning tag attributes, override defaults
-        self.attributes = self.default_attributes.copy()
-        if 'name' in kwargs:
-            self.name = kwargs.get('name')
+        # Assigning tag attributes, the defaults are shared until overridden
+        self._attributes = None
         self._classes = None
-        if 'class_' in kwargs:
-            self.classes = kwargs['class_']
-            del kwargs['class_']
-        if 'safe' in kwargs:
-            self.safe = kwargs['safe']
-            del kwargs['safe']
-        if 'children_delimiter' in kwargs:
-            self.children_delimiter = kwargs['children_delimiter']
-            del kwargs['children_delimiter']
-
-        for key in kwargs:
-            escaped_key = key[:-1] if key.endswith('_') else key
-            escaped_key = escaped_key.replace('_', '-')
-            self.attributes[escaped_key] = kwargs[key]
+        self._safe = self._default_safe
+        self._delimiter = self._default_children_delimiter
+        self._frozen = False
+        self._html = None
+        self._tracker = None
+        if kwargs:
+            if 'name' in kwargs:
+                self.name = kwargs['name']
+            if 'class_' in kwargs:
+                self.classes = kwargs.pop('class_')
+            if 'safe' in kwargs:
+                self._safe = kwargs.pop('safe')
+            if 'children_delimiter' in kwargs:
+                self._delimiter = kwargs.pop('children_delimiter')
+
+        if kwargs:
+            attributes = self._attributes = self.default_attributes.copy()
+            for key in kwargs:
+                attributes[_attribute_name(key)] = kwargs[key]
+        else:
+            attributes = self.default_attributes
 
         # Check if all required attributes are set
         for key in self.required_attributes:
-            if key not in self.attributes:
+            if key not in attributes:
                 raise KeyError
 
+    @classmethod
+    def _fast(cls, children=(), attributes=None):
+        """Create a tag without the keyword argument handling of ``__init__``.
+
+        :param children: A list of children, or a single one if it is a string
+        :param attributes: A dictionary of attributes by their HTML names, where
+            ``class`` gives the classes of the tag
+        """
+        tag = cls.__new__(cls)
+        tag.children = [children] if isinstance(children, basestring) else list(children)
+        if tag.children and cls.singleton:
+            raise TagSingletonError
+        tag._attributes = None
+        tag._classes = None
+        tag._safe = cls._default_safe
+        tag._delimiter = cls._default_children_delimiter
+        tag._frozen = False
+        tag._html = None
+        tag._tracker = None
+        if attributes:
+            if 'class' in attributes:
+                value = attributes['class']
+                if isinstance(value, basestring):
+                    tag._classes = list(cls.default_classes)
+                    tag._classes.extend(value.split(' '))
+                else:
+                    tag.classes = value
+            if 'name' in attributes:
+                tag.name = attributes['name']
+            if len(attributes) > ('class' in attributes):
+                merged = tag._attributes = cls.default_attributes.copy()
+                merged.update(attributes)
+                merged.pop('class', None)
+        if cls.required_attributes:
+            for key in cls.required_attributes:
+                if key not in tag.attributes:
+                    raise KeyError
+        return tag
+
+    @property
+    def attributes(self):
+        if self._attributes is None:
+            self._attributes = self.default_attributes.copy()
+            if self._tracker is not None:
+                self._tracker._track_attributes(self)
+        return self._attributes
+
+    @attributes.setter
+    def attributes(self, value):
+        if self._frozen:
+            raise TagFrozenError
+        self._attributes = value
+        if self._tracker is not None:
+            self._tracker._changed(self)
+
+    @property
+    def safe(self):
+        return self._safe
+
+    @safe.setter
+    def safe(self, value):
+        if self._frozen:
+            raise TagFrozenError
+        self._safe = value
+        if self._tracker is not None:
+            self._tracker._changed(self)
+
+    @property
+    def children_delimiter(self):
+        return self._delimiter
+
+    @children_delimiter.setter
+    def children_delimiter(self, value):
+        if self._frozen:
+            raise TagFrozenError
+        self._delimiter = value
+        if self._tracker is not None:
+            self._tracker._changed(self)
+
+    @property
+    def frozen(self):
+        return self._frozen
+
     @property
     def classes(self):
         if self._classes is not None:
@@ -74,12 +401,16 @@ class Tag(Node):
             return ' '.join(self.default_classes)
 
     def append(self, *args):
+        if self._frozen:
+            raise TagFrozenError
         if not self.singleton:
             for elm in args:
                 self.children.append(elm)
         return self
 
     def prepend(self, *args):
+        if self._frozen:
+            raise TagFrozenError
         if not self.singleton:
             for elm in args[::-1]:
                 self.children.insert(0, elm)
@@ -87,23 +418,77 @@ class Tag(Node):
 
     @classes.setter
     def classes(self, value):
-        self._classes = []
-        self._classes.extend(self.default_classes)
+        if self._frozen:
+            raise TagFrozenError
+        classes = list(self.default_classes)
         if isinstance(value, basestring):
-            self._classes.extend(value.split(' '))
+            classes.extend(value.split(' '))
         elif isinstance(value, list):
             for c in value:
-                if c not in self._classes:
-                    self._classes.append(c)
+                if c not in classes:
+                    classes.append(c)
         elif isinstance(value, dict):
             for key in value:
                 if value[key]:
-                    self._classes.append(key)
-
-    def render(self):
-        return self.__unicode__()
+                    classes.append(key)
+        self._classes = classes
+        if self._tracker is not None:
+            self._tracker._changed(self)
+
+    def render(self, profile=None):
+        """Render the HTML, instrumenting it in a :class:`~html_node.profiling.RenderProfile`
+        if ``profile`` is given."""
+        return u''.join(_serialize((self,), native=self, profile=profile))
+
+    def iter_render(self, profile=None):
+        """Yield the rendered HTML in document order as a series of small chunks."""
+        return _serialize((self,), chunk_size=CHUNK_SIZE, native=self, profile=profile)
+
+    def render_to(self, fp, encoding='utf-8', buffer_size=BUFFER_SIZE, profile=None):
+        """Write the rendered HTML encoded into a file-like object or a WSGI ``write``
+        callable, without building the whole document in memory.
+
+        :return: The number of bytes written
+        """
+        return write_encoded(self.iter_render(profile=profile), fp, encoding=encoding, buffer_size=buffer_size)
+
+    def _open_tag(self):
+        start, end, close, default = _markups(type(self))
+        if self._attributes is None and self._classes is None:
+            return default
+
+        attributes = self.default_attributes if self._attributes is None else self._attributes
+        classes = ' '.join(self.default_classes if self._classes is None else self._classes)
+        if classes:
+            attributes = dict(attributes)
+            attributes['class'] = classes
+        partial = html_params(attributes)
+        return start + u' ' + partial + end if partial.strip() else start + end
+
+    def _close_tag(self):
+        return _markups(type(self))[2]
+
+    def freeze(self):
+        """Make the tag and all its descendents immutable, and cache its rendered HTML.
+
+        The cached HTML is spliced in verbatim whenever the tag is rendered afterwards,
+        and any further modification raises :class:`TagFrozenError`.
+        """
+        if self._frozen:
+            return self
+        stack = [self]
+        while stack:
+            tag = stack.pop()
+            tag.children = tuple(tag.children)
+            tag._attributes = _FrozenDict(tag.attributes)
+            tag._frozen = True
+            stack.extend(child for child in tag.children if isinstance(child, Tag) and not child._frozen)
+        self._html = u''.join(_serialize((self,)))
+        return self
 
     def __call__(self, *args):
+        if self._frozen:
+            raise TagFrozenError
         for item in args:
             if isinstance(item, list) or isinstance(item, tuple):
                 for nested_item in item:
@@ -113,236 +498,367 @@ class Tag(Node):
         return self
 
     def __unicode__(self):
-        attributes = copy.copy(self.attributes)
-        inner_nodes = map(lambda x: x if isinstance(x, Node) or self.safe else escape(unicode(x)), self.children)
-        inner_html = self.children_delimiter.join([unicode(n) for n in inner_nodes])
-        if self.classes:
-            attributes['class'] = self.classes
-        attribute_partial = html_params(attributes)
-        if self.singleton:
-            return render_tag(self.tagname, attribute_partial, type_=TAG_TYPE_SINGLETON)
-        else:
-            return u'{open}{inner}{close}'.format(
-                open=render_tag(self.tagname, attribute_partial, type_=TAG_TYPE_OPEN),
-                inner=inner_html,
-                close=render_tag(self.tagname, type_=TAG_TYPE_CLOSE)
-            )
+        return self.render()
+
+    def __reduce__(self):
+        """Pickle the slots and the instance dictionary if any. Classes created by the
+        factory are not importable, so they are pickled by their name in the factory.
+        Copies of tracked tags are not tracked."""
+        cls = type(self)
+        state = dict((key, getattr(self, key)) for key in Tag.__slots__ if hasattr(self, key))
+        state.update(getattr(self, '__dict__', {}))
+        if state.pop('_tracker', None) is not None:
+            state['_html'] = None
+        return _unpickle_tag, (cls.__dict__.get('_factory_key', cls), state)
 
     def __str__(self):
         return self.__unicode__()
 
 
+def _unpickle_tag(cls, state):
+    if isinstance(cls, basestring):
+        cls = getattr(html_node, cls)
+    tag = cls.__new__(cls)
+    tag._tracker = None
+    for key, value in state.iteritems():
+        object.__setattr__(tag, key, value)
+    return tag
+
+
 # Tags with special behaviors
 # ===========================
 class Html5(Tag):
+    __slots__ = ()
     tagname = 'html'
-
-    def __unicode__(self):
-        return u'<!DOCTYPE HTML>{}'.format(super(Html5, self).__unicode__())
+    doctype = u'<!DOCTYPE HTML>'
 
 class Link(Tag):
+    __slots__ = ()
     singleton = True
     default_attributes = {'rel': 'text/css'}
     required_attributes = ['href']
 
 class Script(Tag):
+    __slots__ = ()
     safe = True
     default_attributes = {'type': 'text/javascript'}
 
+class Table(Tag):
+    __slots__ = ()
+
+    @classmethod
+    def from_rows(cls, rows, columns=None, formatters=None, header=True, batch_size=100, **kwargs):
+        """Build a table from bulk data, without creating a tag for every cell.
+
+        The rows are rendered through a precomputed row template, batch by batch while
+        the table is rendered, so an iterator of rows larger than memory can be streamed.
+        Cells of None are left empty, other cells are escaped unless they are Markup.
+
+        :param rows: Either an iterable of sequences or of dictionaries, a dictionary of
+            columns, or a 2-D NumPy array
+        :param columns: Keys of the columns, which are required for rows of dictionaries.
+            They are the sorted keys of a dictionary of columns by default
+        :param formatters: A list of functions to format each column, or a dictionary of
+            them by column key or index
+        :param header: Render the columns as the header of the table
+        :param batch_size: Number of rows rendered together
+        :param kwargs: Attributes of the table
+        """
+        if isinstance(rows, dict):
+            columns = columns or sorted(rows)
+
+        table = cls(**kwargs)
+        if header and columns:
+            table.append(html_node.thead(html_node.tr()([html_node.th(column) for column in columns])))
+        return table.append(html_node.tbody(_TableRows(rows, columns, formatters, batch_size)))
+
+
+class _TableRows(Node):
+    """Rows of a table which are rendered from bulk data only when it is rendered.
+
+    Arrays and dictionaries of columns are iterated again on every render, while an
+    iterator of rows is consumed by the first one.
+    """
+    def __init__(self, rows, columns=None, formatters=None, batch_size=100):
+        self.rows = rows
+        self.columns = columns
+        self.formatters = formatters
+        self.batch_size = batch_size
+
+    def _formatters(self, length):
+        formatters = self.formatters
+        if isinstance(formatters, dict):
+            keys = self.columns or range(length)
+            return [formatters.get(key, formatters.get(index)) for index, key in enumerate(keys)]
+        return list(formatters or [])
+
+    def _rows(self):
+        rows = self.rows
+        if hasattr(rows, 'ndim'):
+            return (row.tolist() for row in rows)
+        elif isinstance(rows, dict):
+            return itertools.izip(*[rows[column] for column in self.columns])
+        return rows
+
+    def iter_render(self):
+        templates = {}
+        formatters = None
+        batch = []
+        for row in self._rows():
+            if isinstance(row, dict):
+                row = [row.get(column) for column in self.columns]
+            if formatters is None:
+                formatters = self._formatters(len(row))
+            if formatters:
+                row = [value if formatter is None or value is None else formatter(value)
+                       for value, formatter in itertools.izip_longest(row, formatters[:len(row)])]
+            template = templates.get(len(row))
+            if template is None:
+                template = templates[len(row)] = u'<tr>' + u'<td>%s</td>' * len(row) + u'</tr>'
+            batch.append(template % tuple([_render_cell(value) for value in row]))
+            if len(batch) >= self.batch_size:
+                yield u''.join(batch)
+                del batch[:]
+        if batch:
+            yield u''.join(batch)
+
+    def __unicode__(self):
+        return u''.join(self.iter_render())
+
+
+def _render_cell(value):
+    cls = type(value)
+    if cls is unicode or cls is str:
+        return escape(unicode(value))
+    elif value is None:
+        return u''
+    elif cls is Markup:
+        return value
+    elif isinstance(value, Node):
+        return u''.join(_serialize((value,)))
+    elif hasattr(value, '__html__'):
+        return value.__html__()
+    return escape(unicode(value))
+
+
 class A(Tag):
+    __slots__ = ()
     default_attributes = {'href': 'javascript:void(0)'}
 
 class Img(Tag):
+    __slots__ = ()
     singleton = True
     required_attributes = ['src']
 
 class Input(Tag):
+    __slots__ = ()
     singleton = True
 
 class Br(Tag):
+    __slots__ = ()
     singleton = True
 
 class Base(Tag):
+    __slots__ = ()
     singleton = True
 
 class Area(Tag):
+    __slots__ = ()
     singleton = True
 
 class Col(Tag):
+    __slots__ = ()
     singleton = True
 
 class Command(Tag):
+    __slots__ = ()
     singleton = True
 
 class Embed(Tag):
+    __slots__ = ()
     singleton = True
 
 class Hr(Tag):
+    __slots__ = ()
     singleton = True
 
 class Keygen(Tag):
+    __slots__ = ()
     singleton = True
 
 class Meta(Tag):
+    __slots__ = ()
     singleton = True
 
 class Param(Tag):
+    __slots__ = ()
     singleton = True
 
 class Source(Tag):
+    __slots__ = ()
     singleton = True
 
 class Track(Tag):
+    __slots__ = ()
     singleton = True
 
 class Wbr(Tag):
+    __slots__ = ()
     singleton = True
 
 
 # Factory to provide DSL shorthand in creating HTML elements
 # ======================================================
+class _LazyElement(object):
+    """Element of the factory, whose tag class is only created when first accessed."""
+    def __init__(self, name):
+        self.name = name
+
+    def __get__(self, factory, owner):
+        if factory is None:
+            return self
+        return factory._get_tag(self.name)
+
+
 class _HtmlFactory(object):
     """Provide HTML5 elements.
 
     A new tag class can be created using the factory dynamically. Common and valid
-    elements are created here for introspection and autocompletion."""
+    elements are declared here for introspection and autocompletion, but their
+    classes are only created on first access. Every tag class is then cached as an
+    attribute of the factory, so later lookups are plain attribute accesses."""
+    # Extracted from http://www.quackit.com/html_5/tags/
+    a = _LazyElement('a')
+    abbr = _LazyElement('abbr')
+    address = _LazyElement('address')
+    area = _LazyElement('area')
+    article = _LazyElement('article')
+    aside = _LazyElement('aside')
+    audio = _LazyElement('audio')
+    b = _LazyElement('b')
+    base = _LazyElement('base')
+    bdi = _LazyElement('bdi')
+    bdo = _LazyElement('bdo')
+    blockquote = _LazyElement('blockquote')
+    body = _LazyElement('body')
+    br = _LazyElement('br')
+    button = _LazyElement('button')
+    canvas = _LazyElement('canvas')
+    caption = _LazyElement('caption')
+    cite = _LazyElement('cite')
+    code = _LazyElement('code')
+    col = _LazyElement('col')
+    colgroup = _LazyElement('colgroup')
+    command = _LazyElement('command')
+    data = _LazyElement('data')
+    datagrid = _LazyElement('datagrid')
+    datalist = _LazyElement('datalist')
+    dd = _LazyElement('dd')
+    details = _LazyElement('details')
+    dfn = _LazyElement('dfn')
+    div = _LazyElement('div')
+    dl = _LazyElement('dl')
+    dt = _LazyElement('dt')
+    em = _LazyElement('em')
+    embed = _LazyElement('embed')
+    eventsource = _LazyElement('eventsource')
+    fieldset = _LazyElement('fieldset')
+    figcaption = _LazyElement('figcaption')
+    figure = _LazyElement('figure')
+    footer = _LazyElement('footer')
+    form = _LazyElement('form')
+    h1 = _LazyElement('h1')
+    h2 = _LazyElement('h2')
+    h3 = _LazyElement('h3')
+    h4 = _LazyElement('h4')
+    h5 = _LazyElement('h5')
+    h6 = _LazyElement('h6')
+    head = _LazyElement('head')
+    header = _LazyElement('header')
+    hgroup = _LazyElement('hgroup')
+    hr = _LazyElement('hr')
+    html = _LazyElement('html')
+    i = _LazyElement('i')
+    iframe = _LazyElement('iframe')
+    img = _LazyElement('img')
+    input = _LazyElement('input')
+    ins = _LazyElement('ins')
+    kbd = _LazyElement('kbd')
+    keygen = _LazyElement('keygen')
+    label = _LazyElement('label')
+    legend = _LazyElement('legend')
+    li = _LazyElement('li')
+    link = _LazyElement('link')
+    mark = _LazyElement('mark')
+    map = _LazyElement('map')
+    menu = _LazyElement('menu')
+    meta = _LazyElement('meta')
+    meter = _LazyElement('meter')
+    nav = _LazyElement('nav')
+    noscript = _LazyElement('noscript')
+    object = _LazyElement('object')
+    ol = _LazyElement('ol')
+    optgroup = _LazyElement('optgroup')
+    option = _LazyElement('option')
+    output = _LazyElement('output')
+    p = _LazyElement('p')
+    param = _LazyElement('param')
+    pre = _LazyElement('pre')
+    progress = _LazyElement('progress')
+    q = _LazyElement('q')
+    ruby = _LazyElement('ruby')
+    rp = _LazyElement('rp')
+    rt = _LazyElement('rt')
+    s = _LazyElement('s')
+    samp = _LazyElement('samp')
+    script = _LazyElement('script')
+    section = _LazyElement('section')
+    select = _LazyElement('select')
+    small = _LazyElement('small')
+    source = _LazyElement('source')
+    span = _LazyElement('span')
+    strong = _LazyElement('strong')
+    style = _LazyElement('style')
+    sub = _LazyElement('sub')
+    summary = _LazyElement('summary')
+    sup = _LazyElement('sup')
+    table = _LazyElement('table')
+    tbody = _LazyElement('tbody')
+    td = _LazyElement('td')
+    textarea = _LazyElement('textarea')
+    tfoot = _LazyElement('tfoot')
+    th = _LazyElement('th')
+    thead = _LazyElement('thead')
+    time = _LazyElement('time')
+    title = _LazyElement('title')
+    tr = _LazyElement('tr')
+    track = _LazyElement('track')
+    u = _LazyElement('u')
+    ul = _LazyElement('ul')
+    var = _LazyElement('var')
+    video = _LazyElement('video')
+    wbr = _LazyElement('wbr')
+
     def __init__(self):
         self.__cache = {}
-        self.__load_default_elements()
-
-    def __load_default_elements(self):
-        """Create here for IDE to introspect. Make autocomplete possible."""
-        # Extracted from http://www.quackit.com/html_5/tags/
-        self.a = self.__get_tag('a')
-        self.abbr = self.__get_tag('abbr')
-        self.address = self.__get_tag('address')
-        self.area = self.__get_tag('area')
-        self.article = self.__get_tag('article')
-        self.aside = self.__get_tag('aside')
-        self.audio = self.__get_tag('audio')
-        self.b = self.__get_tag('b')
-        self.base = self.__get_tag('base')
-        self.bdi = self.__get_tag('bdi')
-        self.bdo = self.__get_tag('bdo')
-        self.blockquote = self.__get_tag('blockquote')
-        self.body = self.__get_tag('body')
-        self.br = self.__get_tag('br')
-        self.button = self.__get_tag('button')
-        self.canvas = self.__get_tag('canvas')
-        self.caption = self.__get_tag('caption')
-        self.cite = self.__get_tag('cite')
-        self.code = self.__get_tag('code')
-        self.col = self.__get_tag('col')
-        self.colgroup = self.__get_tag('colgroup')
-        self.command = self.__get_tag('command')
-        self.data = self.__get_tag('data')
-        self.datagrid = self.__get_tag('datagrid')
-        self.datalist = self.__get_tag('datalist')
-        self.dd = self.__get_tag('dd')
-        self.details = self.__get_tag('details')
-        self.dfn = self.__get_tag('dfn')
-        self.div = self.__get_tag('div')
-        self.dl = self.__get_tag('dl')
-        self.dt = self.__get_tag('dt')
-        self.em = self.__get_tag('em')
-        self.embed = self.__get_tag('embed')
-        self.eventsource = self.__get_tag('eventsource')
-        self.fieldset = self.__get_tag('fieldset')
-        self.figcaption = self.__get_tag('figcaption')
-        self.figure = self.__get_tag('figure')
-        self.footer = self.__get_tag('footer')
-        self.form = self.__get_tag('form')
-        self.h1 = self.__get_tag('h1')
-        self.h2 = self.__get_tag('h2')
-        self.h3 = self.__get_tag('h3')
-        self.h4 = self.__get_tag('h4')
-        self.h5 = self.__get_tag('h5')
-        self.h6 = self.__get_tag('h6')
-        self.head = self.__get_tag('head')
-        self.header = self.__get_tag('header')
-        self.hgroup = self.__get_tag('hgroup')
-        self.hr = self.__get_tag('hr')
-        self.html = self.__get_tag('html')
-        self.i = self.__get_tag('i')
-        self.iframe = self.__get_tag('iframe')
-        self.img = self.__get_tag('img')
-        self.input = self.__get_tag('input')
-        self.ins = self.__get_tag('ins')
-        self.kbd = self.__get_tag('kbd')
-        self.keygen = self.__get_tag('keygen')
-        self.label = self.__get_tag('label')
-        self.legend = self.__get_tag('legend')
-        self.li = self.__get_tag('li')
-        self.link = self.__get_tag('link')
-        self.mark = self.__get_tag('mark')
-        self.map = self.__get_tag('map')
-        self.menu = self.__get_tag('menu')
-        self.meta = self.__get_tag('meta')
-        self.meter = self.__get_tag('meter')
-        self.nav = self.__get_tag('nav')
-        self.noscript = self.__get_tag('noscript')
-        self.object = self.__get_tag('object')
-        self.ol = self.__get_tag('ol')
-        self.optgroup = self.__get_tag('optgroup')
-        self.option = self.__get_tag('option')
-        self.output = self.__get_tag('output')
-        self.p = self.__get_tag('p')
-        self.param = self.__get_tag('param')
-        self.pre = self.__get_tag('pre')
-        self.progress = self.__get_tag('progress')
-        self.q = self.__get_tag('q')
-        self.ruby = self.__get_tag('ruby')
-        self.rp = self.__get_tag('rp')
-        self.rt = self.__get_tag('rt')
-        self.s = self.__get_tag('s')
-        self.samp = self.__get_tag('samp')
-        self.script = self.__get_tag('script')
-        self.section = self.__get_tag('section')
-        self.select = self.__get_tag('select')
-        self.small = self.__get_tag('small')
-        self.source = self.__get_tag('source')
-        self.span = self.__get_tag('span')
-        self.strong = self.__get_tag('strong')
-        self.style = self.__get_tag('style')
-        self.sub = self.__get_tag('sub')
-        self.summary = self.__get_tag('summary')
-        self.sup = self.__get_tag('sup')
-        self.table = self.__get_tag('table')
-        self.tbody = self.__get_tag('tbody')
-        self.td = self.__get_tag('td')
-        self.textarea = self.__get_tag('textarea')
-        self.tfoot = self.__get_tag('tfoot')
-        self.th = self.__get_tag('th')
-        self.thead = self.__get_tag('thead')
-        self.time = self.__get_tag('time')
-        self.title = self.__get_tag('title')
-        self.tr = self.__get_tag('tr')
-        self.track = self.__get_tag('track')
-        self.u = self.__get_tag('u')
-        self.ul = self.__get_tag('ul')
-        self.var = self.__get_tag('var')
-        self.video = self.__get_tag('video')
-        self.wbr = self.__get_tag('wbr')
-
-    def __get_tag(self, item):
+
+    def _get_tag(self, item):
         key = item.lower()
-        if key in self.__cache:
-            return self.__cache[key]
-        else:
+        rv = self.__cache.get(key)
+        if rv is None:
             # If found in special tags, use it
-            class_name = key.lower().capitalize()
-            if class_name in globals():
-                tag_class = globals()[class_name]
-                if issubclass(tag_class, Tag):
-                    rv = tag_class
+            special = globals().get(key.capitalize())
+            if isinstance(special, type) and issubclass(special, Tag):
+                rv = special
             else:
-                rv = type(key, (Tag,), {})
+                rv = type(key, (Tag,), {'__slots__': (), '_factory_key': key})
             self.__cache[key] = rv
-            return rv
+        setattr(self, item, rv)
+        return rv
 
     def __getattr__(self, item):
         """Case insensitive matching for HTML element."""
-        return self.__get_tag(item)
+        return self._get_tag(item)
 
 
 html_node = _HtmlFactory()
@@ -1,8 +1,30 @@
 # -*- coding: utf-8 -*-
-from .tags import Node, Tag, html_node as n
+import marshal
+import os
+import sys
+import thread
+import time
+from collections import OrderedDict
+from .tags import CHUNK_SIZE, Node, Tag, html_node as n, _serialize
+from .profiling import measure, measure_chunks
+from .utils import BUFFER_SIZE, Markup, write_encoded
+from . import __version__
 
 
-__all__ = ['Placeholder', 'placeholder', 'BaseTemplate', 'BaseLayout']
+__all__ = ['CompiledContextError', 'Placeholder', 'ContextValue', 'placeholder', 'FragmentCache', 'BaseTemplate',
+           'BaseLayout']
+
+_MISSING = object()
+_compile_lock = thread.allocate_lock()
+# Maximum number of threads created to evaluate placeholders concurrently
+MAX_THREADS = 16
+# Digests of the source files of template classes, by path
+_source_digests = {}
+
+
+class CompiledContextError(Exception):
+    """Raised when a compiled template reads its context while building its tree."""
+    pass
 
 
 class Placeholder(Node):
@@ -10,9 +32,38 @@ class Placeholder(Node):
     def __init__(self, name):
         self.name = name
 
+    def bind(self, placeholders):
+        return placeholders[self.name]
+
+
+class ContextValue(Node):
+    """Stub to fill in with a value of the context of the template being rendered.
+
+    Compiled templates keep it as a slot, so it is read again from the context on every render.
+    """
+    def __init__(self, name):
+        self.name = name
+
+    def bind(self, placeholders):
+        return placeholders.template.context.get(self.name)
+
+
+class _CompilingContext(dict):
+    """Context of a template while it is being compiled, which cannot be read."""
+    def _read(self, *args, **kwargs):
+        raise CompiledContextError('The context cannot be read in the template() of a compiled template, '
+                                   'use ContextValue or a placeholder instead')
+
+    __getitem__ = __contains__ = __iter__ = get = has_key = keys = values = items = _read
+    iterkeys = itervalues = iteritems = copy = _read
+
 def fill(tag, placeholders):
-    """Recursively fill in the placeholders of descendents of any Tag in place."""
-    if isinstance(tag, Tag):
+    """Recursively fill in the placeholders of descendents of any Tag in place.
+
+    Frozen tags are left untouched, as they cannot be modified. Templates do not
+    need it to render, as they bind the placeholders without modifying the tree.
+    """
+    if isinstance(tag, Tag) and not tag.frozen:
         for index in range(0, len(tag.children)):
             if isinstance(tag.children[index], Placeholder):
                 tag.children[index] = fill(placeholders[tag.children[index].name], placeholders=placeholders)
@@ -21,11 +72,79 @@ def fill(tag, placeholders):
     return tag
 
 
-def placeholder(arg):
+class FragmentCache(object):
+    """Least recently used cache of rendered placeholders, with an optional time to live.
+
+    It is shared by all instances of the templates, and is safe to use across threads.
+    """
+    def __init__(self, maxsize=128, ttl=None):
+        """
+        :param maxsize: Maximum number of entries kept, the least recently used is evicted first
+        :param ttl: Number of seconds before an entry expires, or None to keep it until evicted
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.__entries = OrderedDict()
+        self.__lock = thread.allocate_lock()
+
+    def get(self, key, default=None):
+        with self.__lock:
+            entry = self.__entries.pop(key, _MISSING)
+            if entry is not _MISSING and (entry[0] is None or entry[0] > time.time()):
+                self.__entries[key] = entry
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        expires = time.time() + self.ttl if self.ttl is not None else None
+        with self.__lock:
+            self.__entries.pop(key, None)
+            self.__entries[key] = (expires, value)
+            while len(self.__entries) > self.maxsize:
+                self.__entries.popitem(last=False)
+
+    def clear(self):
+        with self.__lock:
+            self.__entries.clear()
+            self.hits = self.misses = 0
+
+    def __len__(self):
+        return len(self.__entries)
+
+
+def anchors(tag):
+    """List the names of the placeholders anchored in descendents of any Tag."""
+    names = []
+    stack = [tag]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, Placeholder):
+            names.append(node.name)
+        elif isinstance(node, Tag) and not node.frozen:
+            stack.extend(reversed(node.children))
+    return names
+
+
+def placeholder(arg=None, key=None, maxsize=128, ttl=None):
     """Decorate a class method to create a placeholder with the same name as the method name.
 
+    Used with keyword arguments instead, the rendered placeholder is cached in a
+    :class:`FragmentCache` across template instances. ``key`` computes the cache key
+    from the context of the template, the placeholder is cached regardless of the
+    context if it is not given.
+
     ... 2013-07-07 - add ability to be use as Placeholder anchor in the template also
     """
+    if arg is None:
+        def decorator(method):
+            method.cache = FragmentCache(maxsize=maxsize, ttl=ttl)
+            method.cache_key = key or (lambda context: None)
+            return placeholder(method)
+        return decorator
     if isinstance(arg, basestring):
         # put an anchor
         return Placeholder(arg)
@@ -35,8 +154,163 @@ def placeholder(arg):
         return arg
 
 
+def compile_template(tree):
+    """Serialize a template tree into static markup segments, placeholder and context slots.
+
+    Static markup is kept as unicode strings, while each placeholder anchor or context
+    value becomes a ``(name, safe, context)`` slot, ``safe`` telling if the filled in text
+    needs no escaping and ``context`` if it is a value of the context.
+    """
+    segments = []
+    for chunk in _serialize((tree,), slots=(Placeholder, ContextValue), native=tree):
+        if isinstance(chunk, tuple):
+            anchor, safe = chunk
+            chunk = (anchor.name, safe, isinstance(anchor, ContextValue))
+        segments.append(chunk)
+    return segments
+
+
+def _source_digest(cls):
+    """Get the digest of the source file of a class, which is read only once."""
+    import hashlib
+    import inspect
+    path = inspect.getsourcefile(cls) or inspect.getfile(cls)
+    digest = _source_digests.get(path)
+    if digest is None:
+        with open(path, 'rb') as fp:
+            digest = _source_digests[path] = hashlib.sha1(fp.read()).hexdigest()
+    return digest
+
+
+def _segments_path(cls):
+    """Get the path of the compiled segments of a template class in its cache directory.
+
+    The name depends on the versions of HtmlNode and Python, on the class and its
+    ``template`` method, and on the source files of the template classes it inherits
+    from. None is returned if the class has no cache directory, or its source cannot
+    be found.
+    """
+    if cls.compile_cache_dir is None:
+        return None
+    import hashlib
+    code = cls.template.im_func.func_code
+    key = [__version__, sys.version, cls.__module__, cls.__name__, code.co_filename, str(code.co_firstlineno)]
+    try:
+        key.extend(_source_digest(base) for base in cls.__mro__ if issubclass(base, BaseTemplate))
+    except (IOError, TypeError):
+        return None
+    name = '%s.%s-%s.segments' % (cls.__module__, cls.__name__, hashlib.sha1('\0'.join(key)).hexdigest())
+    return os.path.join(cls.compile_cache_dir, name)
+
+
+def _load_segments(path):
+    """Load compiled segments from a file, or get None if it is missing or invalid."""
+    try:
+        with open(path, 'rb') as fp:
+            segments = marshal.load(fp)
+    except (IOError, EOFError, ValueError, TypeError):
+        return None
+    return segments if isinstance(segments, list) else None
+
+
+def _save_segments(path, segments):
+    """Save compiled segments into a file, which is replaced atomically. Failures are
+    ignored, as the segments are compiled again in the next process."""
+    import tempfile
+    directory = os.path.dirname(path)
+    try:
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        fd, temp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    except OSError:
+        return
+    try:
+        with os.fdopen(fd, 'wb') as fp:
+            marshal.dump(segments, fp)
+        os.rename(temp, path)
+    except (IOError, OSError):
+        os.remove(temp)
+
+
+class _PlaceholderScope(dict):
+    """Placeholders of a template being rendered, evaluated when first looked up.
+
+    Anchors are bound to it while rendering, so neither the tree of the template nor
+    the values of its placeholders are modified, and they can be shared across renders.
+    """
+    def __init__(self, template, profile=None):
+        super(_PlaceholderScope, self).__init__()
+        self.template = template
+        self.profile = profile
+
+    def __missing__(self, name):
+        with measure(self.profile, 'placeholders', name):
+            value = self.__evaluate(name)
+        self[name] = value
+        return value
+
+    def __evaluate(self, name):
+        method = type(self.template)._placeholders[name]
+        cache = getattr(method, 'cache', None)
+        if cache is None:
+            value = method(self.template)
+        else:
+            cache_key = (type(self.template), method.cache_key(self.template.context))
+            value = cache.get(cache_key, _MISSING)
+            if value is _MISSING:
+                value = method(self.template)
+                if isinstance(value, Node):
+                    value = Markup(u''.join(_serialize((value,), scope=self)))
+                cache.set(cache_key, value)
+        return value
+
+
+def _evaluate_concurrently(placeholders, names, pool=None):
+    """Evaluate placeholders in threads before rendering them.
+
+    The placeholders anchored in the template are evaluated concurrently, then
+    those anchored in their values, and so on. A thread pool of at most
+    ``MAX_THREADS`` threads is created for the evaluation unless one is given.
+    """
+    from multiprocessing.pool import ThreadPool
+    own_pool = None
+    try:
+        while names:
+            names = [name for name in OrderedDict.fromkeys(names) if name not in placeholders]
+            if not names:
+                break
+            if pool is None:
+                pool = own_pool = ThreadPool(min(len(names), MAX_THREADS))
+            values = pool.map(placeholders.__getitem__, names)
+            names = [name for value in values for name in anchors(value)]
+    finally:
+        if own_pool is not None:
+            own_pool.close()
+
+
+class TemplateMeta(type):
+    """Collect the placeholder methods of a template class once, on its creation."""
+    def __init__(cls, name, bases, attrs):
+        super(TemplateMeta, cls).__init__(name, bases, attrs)
+        cls._placeholders = {}
+        for key in dir(cls):
+            method = getattr(cls, key)
+            if getattr(method, 'is_placeholder', False):
+                method = getattr(method, '__func__', method)
+                cls._placeholders[method.__name__] = method
+
+
 class BaseTemplate(Node):
+    __metaclass__ = TemplateMeta
     default_context = {}
+    # Set to True if `template` does not read the context, so that its static markup is
+    # serialized only once for the class and reused on every render. Anchor values of
+    # the context with `ContextValue` instead
+    compiled = False
+    # Directory where compiled templates are saved, so that other processes load them
+    # instead of compiling them again. Clear it if they depend on anything else than
+    # the source of their classes
+    compile_cache_dir = None
 
     def __init__(self, context={}, **kwargs):
         """The most basic template, which uses placeholder for rendering.
@@ -44,7 +318,6 @@ class BaseTemplate(Node):
         :param context: A dictionary of Context to bring into the template
         :param kwargs: Key word argument which overrides the value in the context
         """
-        self.__placeholders = {}
         self.context = {}
         self.context.update(self.default_context)
         self.context.update(context)
@@ -53,23 +326,100 @@ class BaseTemplate(Node):
         # Make shorthand available
         self.c = self.context.get
 
-        self.__extract_placeholders()
-
-    def __extract_placeholders(self):
-        """Get placeholders from its declared methods which decorated as `placeholder`."""
-        for key in dir(self):
-            method = getattr(self, key)
-            if getattr(method, 'is_placeholder', False):
-                self.__placeholders[method.__name__] = method()
-
     def template(self):
         raise NotImplementedError
 
-    def render(self):
-        return self.__unicode__()
+    def render(self, profile=None):
+        """Render the template, instrumenting it in a :class:`~html_node.profiling.RenderProfile`
+        if ``profile`` is given."""
+        return u''.join(self.iter_render(profile=profile))
+
+    def iter_render(self, profile=None):
+        """Yield the rendered template in document order as a series of small chunks."""
+        return self.__iter_render(_PlaceholderScope(self, profile))
+
+    def render_to(self, fp, encoding='utf-8', buffer_size=BUFFER_SIZE, profile=None):
+        """Write the rendered template encoded into a file-like object or a WSGI ``write``
+        callable, without building the whole document in memory.
+
+        :return: The number of bytes written
+        """
+        return write_encoded(self.iter_render(profile=profile), fp, encoding=encoding, buffer_size=buffer_size)
+
+    def render_concurrent(self, pool=None, profile=None):
+        """Render the template, evaluating independent placeholders concurrently.
+
+        :param pool: A `multiprocessing.pool.ThreadPool` to evaluate the placeholders,
+            otherwise one is created for the render
+        """
+        return u''.join(self.iter_render_concurrent(pool=pool, profile=profile))
+
+    def iter_render_concurrent(self, pool=None, profile=None):
+        """Stream the template like `iter_render`, after evaluating independent
+        placeholders concurrently like `render_concurrent`."""
+        return self.__iter_render(_PlaceholderScope(self, profile), concurrent=True, pool=pool)
+
+    def __iter_render(self, placeholders, concurrent=False, pool=None):
+        profile = placeholders.profile
+        if self.compiled:
+            segments = self.__segments(profile)
+            if concurrent:
+                names = [segment[0] for segment in segments if not isinstance(segment, unicode) and not segment[2]]
+                _evaluate_concurrently(placeholders, names, pool=pool)
+            return self.__iter_compiled(segments, placeholders)
+
+        with measure(profile, 'phases', 'template'):
+            tree = self.template()
+        if concurrent:
+            _evaluate_concurrently(placeholders, anchors(tree), pool=pool)
+        chunks = _serialize((tree,), chunk_size=CHUNK_SIZE, profile=profile, scope=placeholders)
+        return measure_chunks(profile, 'phases', 'serialize', chunks)
+
+    def __segments(self, profile=None):
+        """Get the segments of the compiled class, loading them from the cache directory
+        or compiling them on the first render."""
+        cls = type(self)
+        segments = cls.__dict__.get('_segments')
+        if segments is None:
+            with _compile_lock:
+                segments = cls.__dict__.get('_segments')
+                if segments is None:
+                    path = _segments_path(cls)
+                    segments = _load_segments(path) if path is not None else None
+                    if segments is None:
+                        with measure(profile, 'phases', 'template'):
+                            segments = compile_template(self.__compiling_template())
+                        if path is not None:
+                            _save_segments(path, segments)
+                    cls._segments = segments
+        return segments
+
+    def __compiling_template(self):
+        """Build the tree of the template, raising CompiledContextError if it reads the context."""
+        context, c = self.context, self.c
+        self.context = _CompilingContext()
+        self.c = self.context.get
+        try:
+            return self.template()
+        finally:
+            self.context, self.c = context, c
+
+    def __iter_compiled(self, segments, placeholders):
+        """Render the precomputed segments of the class, evaluating only the slots."""
+        profile = placeholders.profile
+        for segment in segments:
+            if isinstance(segment, unicode):
+                yield segment
+            else:
+                name, safe, context = segment
+                value = self.context.get(name) if context else placeholders[name]
+                chunks = _serialize((value,), safe=safe, chunk_size=CHUNK_SIZE, profile=profile,
+                                    scope=placeholders)
+                for chunk in measure_chunks(profile, 'phases', 'serialize', chunks):
+                    yield chunk
 
     def __unicode__(self):
-        return fill(self.template(), self.__placeholders).render()
+        return self.render()
 
     def __str__(self):
         return self.__unicode__()
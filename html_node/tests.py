@@ -1,7 +1,25 @@
 # -*- coding: utf-8 -*-
+import cgi
+import io
+import os
+import tempfile
+import pickle
+import shutil
+import socket
+import sys
+import threading
+import time
+import multiprocessing.pool
+from multiprocessing.pool import ThreadPool
 from nose.tools import raises, eq_, ok_
-from .tags import TagSingletonError, Tag, html_node as h
-from .templates import BaseLayout
+from .tags import TagSingletonError, TagFrozenError, Node, Tag, html_node as h, _attribute_name, _attribute_names
+from .utils import TAG_TYPE_OPEN, TAG_TYPE_CLOSE, TAG_TYPE_SINGLETON, Markup, escape, render_tag, html_params
+from .parallel import render_parallel
+from .profiling import RenderProfile
+from . import cli, fragments, parallel, templates
+from .templates import BaseLayout, CompiledContextError, ContextValue, FragmentCache, Placeholder, fill, placeholder
+from .tracking import Index, TagTrackedError, Tracker
+from .fragments import FileFragment
 
 
 class Sample(Tag):
@@ -135,3 +153,936 @@ def test_tag_dynamically_created_should_be_same_class():
     tag1 = h.dtag
     tag2 = h.dtag
     eq_(tag1, tag2)
+
+def test_tag_iter_render_should_yield_chunks_in_document_order():
+    tag = Sample(Sample('a'), '<b>', h.br(), children=[Sample(i) for i in range(1000)])
+    chunks = list(tag.iter_render())
+    ok_(len(chunks) > 1)
+    ok_(u''.join(chunks).startswith(u'<test><test>a</test>&lt;b&gt;<br /><test>0</test>'))
+    eq_(u''.join(chunks), tag.render())
+
+def test_tag_iter_render_should_respect_children_delimiter():
+    tag = Sample('a', Sample('b'), 'c', children_delimiter=u', ')
+    eq_(u''.join(tag.iter_render()), u'<test>a, <test>b</test>, c</test>')
+
+def test_template_iter_render_should_match_render():
+    layout = BaseLayout(title='Hello World')
+    eq_(u''.join(layout.iter_render()), layout.render())
+
+def _legacy_unicode(tag):
+    """The former recursive renderer of Tag, kept to check the render engine against."""
+    attributes = dict(tag.attributes)
+    if tag.classes:
+        attributes['class'] = tag.classes
+    inner_nodes = [x if isinstance(x, Node) or tag.safe else cgi.escape(unicode(x)) for x in tag.children]
+    inner_html = tag.children_delimiter.join([_legacy_unicode(n) if isinstance(n, Tag) else unicode(n)
+                                              for n in inner_nodes])
+    attribute_partial = html_params(attributes)
+    if tag.singleton:
+        return render_tag(tag.tagname, attribute_partial, type_=TAG_TYPE_SINGLETON)
+    return u'{}{}{}'.format(render_tag(tag.tagname, attribute_partial, type_=TAG_TYPE_OPEN),
+                            inner_html, render_tag(tag.tagname, type_=TAG_TYPE_CLOSE))
+
+def test_render_engine_should_match_legacy_renderer():
+    class SafeTag(Sample): safe = True
+    tag = h.div(class_=['a', 'b'], data_id=3)(
+        h.ul(children_delimiter=u'\n')([h.li('<%d>' % i, class_={'odd': i % 2}) for i in range(10)]),
+        SafeTag('<i>safe</i>', h.span('&')),
+        h.img(src='x.png', alt='"quoted"'),
+        h.p(),
+        u'tail & end',
+    )
+    eq_(tag.render(), _legacy_unicode(tag))
+    eq_(u''.join(tag.iter_render()), _legacy_unicode(tag))
+
+def test_render_engine_should_survive_very_deep_trees():
+    depth = sys.getrecursionlimit() * 3
+    root = leaf = Sample()
+    for _ in range(depth):
+        child = Sample()
+        leaf.append(child)
+        leaf = child
+    leaf.append('<deep>')
+    eq_(root.render(), u'<test>' * (depth + 1) + u'&lt;deep&gt;' + u'</test>' * (depth + 1))
+
+def test_render_engine_should_handle_very_wide_trees():
+    tag = h.ul()([h.li(i) for i in range(5000)])
+    html = tag.render()
+    ok_(html.startswith(u'<ul><li>0</li><li>1</li>'))
+    ok_(html.endswith(u'<li>4999</li></ul>'))
+    eq_(u''.join(tag.iter_render()), html)
+
+def test_render_engine_should_delegate_to_custom_unicode():
+    class Custom(Sample):
+        def __unicode__(self):
+            return u'<custom />'
+    eq_(unicode(Sample(Custom())), u'<test><custom /></test>')
+
+class CountingLayout(BaseLayout):
+    template_calls = 0
+
+    def template(self):
+        CountingLayout.template_calls += 1
+        return h.html5(h.head(placeholder('head')), h.body(h.script(placeholder('script')), placeholder('body')))
+
+    @placeholder
+    def script(self):
+        return u'var a = "<b>";'
+
+    @placeholder
+    def body(self):
+        return h.div(placeholder('content'), class_='container')
+
+    @placeholder
+    def content(self):
+        return u'<%s>' % self.c('name')
+
+def test_compiled_template_should_render_identically():
+    class CompiledLayout(CountingLayout):
+        compiled = True
+    for name in ['first', 'second']:
+        eq_(CompiledLayout(name=name).render(), CountingLayout(name=name).render())
+    ok_(u'<div class="container">&lt;second&gt;</div>' in CompiledLayout(name='second').render())
+
+def test_compiled_template_should_build_template_once_per_class():
+    class CompiledLayout(CountingLayout):
+        compiled = True
+    before = CountingLayout.template_calls
+    for i in range(5):
+        CompiledLayout(name=i).render()
+    eq_(CountingLayout.template_calls, before + 1)
+
+def test_compiled_template_should_read_context_values_on_every_render():
+    class GreetingLayout(BaseLayout):
+        compiled = True
+
+        def template(self):
+            return h.html5(h.body(h.h1(ContextValue('name')), placeholder('body')))
+    eq_(GreetingLayout(name='<first>').render(),
+        u'<!DOCTYPE HTML><html><body><h1>&lt;first&gt;</h1><div class="container"></div></body></html>')
+    ok_(u'<h1>second</h1>' in GreetingLayout(name='second').render())
+    ok_(u'<h1>third</h1>' in GreetingLayout(name='third').render_concurrent())
+
+@raises(CompiledContextError)
+def test_compiled_template_cannot_read_the_context_in_template():
+    class GreetingLayout(BaseLayout):
+        compiled = True
+
+        def template(self):
+            return h.html5(h.body(h.h1(self.c('name'))))
+    GreetingLayout(name='first').render()
+
+def test_compiled_template_should_be_loaded_from_cache_directory():
+    directory = tempfile.mkdtemp()
+    class CachedLayout(CountingLayout):
+        compiled = True
+        compile_cache_dir = directory
+    html = CachedLayout(name='first').render()
+    eq_(len(os.listdir(directory)), 1)
+    del CachedLayout._segments
+    before = CountingLayout.template_calls
+    eq_(CachedLayout(name='first').render(), html)
+    eq_(CountingLayout.template_calls, before)
+    shutil.rmtree(directory)
+
+def test_compiled_template_should_ignore_invalid_cache_files():
+    directory = tempfile.mkdtemp()
+    class CachedLayout(CountingLayout):
+        compiled = True
+        compile_cache_dir = directory
+    html = CountingLayout(name='first').render()
+    path = templates._segments_path(CachedLayout)
+    with open(path, 'wb') as fp:
+        fp.write(b'invalid')
+    eq_(CachedLayout(name='first').render(), html)
+    del CachedLayout._segments
+    eq_(CachedLayout(name='first').render(), html)
+    shutil.rmtree(directory)
+
+def test_compiled_template_cache_should_depend_on_the_version():
+    class CachedLayout(CountingLayout):
+        compile_cache_dir = 'cache'
+    path = templates._segments_path(CachedLayout)
+    ok_(path.startswith(os.path.join('cache', 'html_node.tests.CachedLayout-')))
+    version, templates.__version__ = templates.__version__, 'other'
+    try:
+        ok_(templates._segments_path(CachedLayout) != path)
+    finally:
+        templates.__version__ = version
+
+def test_frozen_tag_should_render_identically():
+    tag = h.nav(h.ul()([h.li(h.a(i, href='#%d' % i)) for i in range(3)]), class_='navbar')
+    html = tag.render()
+    eq_(tag.freeze().render(), html)
+    eq_(unicode(Sample(tag, tag)), u'<test>%s%s</test>' % (html, html))
+
+@raises(TagFrozenError)
+def test_frozen_tag_cannot_be_appended():
+    Sample().freeze().append(Sample())
+
+@raises(TagFrozenError)
+def test_frozen_tag_cannot_change_attributes():
+    Sample(a=1).freeze().attributes['a'] = 2
+
+@raises(TagFrozenError)
+def test_frozen_tag_descendents_cannot_be_modified():
+    child = Sample()
+    Sample(child).freeze()
+    child(Sample())
+
+@raises(TagFrozenError)
+def test_frozen_tag_cannot_change_classes():
+    Sample().freeze().classes = 'active'
+
+@raises(TagFrozenError)
+def test_frozen_tag_cannot_become_safe():
+    Sample('<b>').freeze().safe = True
+
+@raises(TagFrozenError)
+def test_frozen_tag_cannot_change_children_delimiter():
+    Sample('a', 'b').freeze().children_delimiter = u', '
+
+class CachedSidebarLayout(BaseLayout):
+    sidebar_calls = 0
+
+    def template(self):
+        return h.html5(h.body(placeholder('sidebar')))
+
+    @placeholder(key=lambda context: context.get('user'), maxsize=2)
+    def sidebar(self):
+        CachedSidebarLayout.sidebar_calls += 1
+        return h.aside(placeholder('greeting'))
+
+    @placeholder
+    def greeting(self):
+        return u'Hello <%s>' % self.c('user')
+
+def test_cached_placeholder_should_be_reused_across_instances():
+    CachedSidebarLayout.sidebar.cache.clear()
+    before = CachedSidebarLayout.sidebar_calls
+    first = CachedSidebarLayout(user='ann').render()
+    eq_(CachedSidebarLayout(user='ann').render(), first)
+    ok_(u'<aside>Hello &lt;ann&gt;</aside>' in first)
+    eq_(CachedSidebarLayout.sidebar_calls, before + 1)
+    eq_(CachedSidebarLayout.sidebar.cache.hits, 1)
+    eq_(CachedSidebarLayout.sidebar.cache.misses, 1)
+
+def test_cached_placeholder_should_evict_least_recently_used():
+    cache = CachedSidebarLayout.sidebar.cache
+    cache.clear()
+    for user in ['a', 'b', 'a', 'c']:
+        CachedSidebarLayout(user=user).render()
+    eq_(len(cache), 2)
+    ok_(cache.get((CachedSidebarLayout, 'a')) is not None)
+    ok_(cache.get((CachedSidebarLayout, 'b')) is None)
+
+def test_fragment_cache_entries_should_expire():
+    cache = FragmentCache(ttl=-1)
+    cache.set('key', u'value')
+    eq_(cache.get('key'), None)
+    eq_(cache.misses, 1)
+
+def test_placeholders_should_be_evaluated_only_when_referenced():
+    class LazyLayout(BaseLayout):
+        @placeholder
+        def unused(self):
+            raise AssertionError('unused placeholder should not be evaluated')
+
+    ok_(u'<title>Welcome!</title>' in LazyLayout().render())
+
+def test_placeholders_should_be_evaluated_once_per_render():
+    calls = []
+    class RepeatedLayout(BaseLayout):
+        def template(self):
+            return h.html5(h.body(placeholder('item'), placeholder('item')))
+
+        @placeholder
+        def item(self):
+            calls.append(1)
+            return h.span('x')
+
+    layout = RepeatedLayout()
+    eq_(layout.render(), u'<!DOCTYPE HTML><html><body><span>x</span><span>x</span></body></html>')
+    eq_(len(calls), 1)
+
+def test_placeholders_should_be_registered_once_per_class():
+    class PropertyLayout(BaseLayout):
+        @property
+        def expensive(self):
+            raise AssertionError('properties should not be evaluated')
+
+        @placeholder
+        def head(self):
+            return h.title('Overridden')
+
+    eq_(sorted(PropertyLayout._placeholders), ['body', 'head'])
+    ok_(u'<title>Overridden</title>' in PropertyLayout().render())
+
+def test_placeholder_overridden_without_decorator_should_be_unregistered():
+    class PlainLayout(BaseLayout):
+        def body(self):
+            return h.div()
+
+    eq_(sorted(PlainLayout._placeholders), ['head'])
+
+def test_factory_tags_should_not_have_instance_dict():
+    ok_(not hasattr(h.td(), '__dict__'))
+    ok_(not hasattr(h.html5(), '__dict__'))
+
+def test_tag_default_attributes_should_be_shared_until_written():
+    tag = h.a('link')
+    ok_(tag._attributes is None)
+    tag.attributes['href'] = '/home'
+    eq_(unicode(tag), u'<a href="/home">link</a>')
+    eq_(h.a.default_attributes, {'href': 'javascript:void(0)'})
+    eq_(unicode(h.a()), u'<a href="javascript:void(0)"></a>')
+
+def test_tag_safe_and_delimiter_can_be_overridden_per_instance():
+    tag = h.script('<b>', '<i>', safe=False, children_delimiter=u' ')
+    eq_(unicode(tag), u'<script type="text/javascript">&lt;b&gt; &lt;i&gt;</script>')
+    ok_(h.script().safe)
+
+def test_tag_safe_and_delimiter_can_be_set_on_the_class():
+    class LateSafe(Sample):
+        pass
+    LateSafe.safe = True
+    LateSafe.children_delimiter = u' '
+    eq_(unicode(LateSafe('<b>', '<i>')), u'<test><b> <i></test>')
+    eq_(unicode(Sample('<b>')), u'<test>&lt;b&gt;</test>')
+
+def test_tagname_should_be_inherited_unless_guessed():
+    class Guessed(Tag):
+        pass
+    class GuessedChild(Guessed):
+        pass
+    class NamedChild(Sample):
+        pass
+    eq_((Guessed.tagname, GuessedChild.tagname, NamedChild.tagname), ('guessed', 'guessedchild', 'test'))
+
+def test_open_tag_should_match_html_params():
+    class Defaults(Sample):
+        default_attributes = {'role': 'grid', 'data-x': '<1>'}
+        default_classes = ['table']
+    for tag in [Defaults(), Defaults(class_='wide'), Defaults(a=True, b=None, c=False), Defaults(role='row')]:
+        attributes = dict(tag.attributes)
+        attributes['class'] = tag.classes
+        eq_(tag._open_tag(), render_tag('test', html_params(attributes), type_=TAG_TYPE_OPEN))
+    eq_(h.img(src='a.png')._open_tag(), u'<img src="a.png" />')
+
+def test_open_tag_should_follow_changes_of_class_defaults():
+    class Btn(Sample):
+        default_classes = ['btn']
+    class Submit(Btn):
+        default_attributes = {'type': 'submit'}
+    eq_(unicode(Btn()), u'<test class="btn"></test>')
+    eq_(unicode(Submit()), u'<test type="submit" class="btn"></test>')
+    Btn.default_classes = ['btn', 'primary']
+    eq_(unicode(Btn()), u'<test class="btn primary"></test>')
+    eq_(unicode(Btn(id='x')), u'<test id="x" class="btn primary"></test>')
+    eq_(unicode(Submit()), u'<test type="submit" class="btn primary"></test>')
+    Btn.tagname = 'button'
+    eq_(unicode(Btn()), u'<button class="btn primary"></button>')
+
+def test_attribute_names_should_be_mangled_once():
+    eq_(_attribute_name('data_id'), 'data-id')
+    eq_(_attribute_name('for_'), 'for')
+    ok_('data_id' in _attribute_names)
+
+def test_escape_should_match_cgi_escape():
+    for text in [u'', u'plain text', u'<a href="x">&amp;</a>', u'"quoted" & <tagged>', 'bytes & <str>']:
+        eq_(escape(text), cgi.escape(text))
+        eq_(escape(text, quote=True), cgi.escape(text, quote=True))
+
+def test_markup_should_not_be_escaped_again():
+    html = Markup(u'<b>bold &amp; safe</b>')
+    eq_(escape(html), html)
+    eq_(unicode(Sample(html, u'<i>')), u'<test><b>bold &amp; safe</b>&lt;i&gt;</test>')
+    eq_(unicode(Sample(title=Markup(u'&amp;'))), u'<test title="&amp;"></test>')
+    eq_(unicode(Sample(title=Markup(u'x"><script>'))), u'<test title="x&quot;><script>"></test>')
+
+def test_objects_with_html_method_should_not_be_escaped():
+    class Html(object):
+        def __html__(self):
+            return u'<hr class="rule" />'
+    eq_(unicode(Sample(Html())), u'<test><hr class="rule" /></test>')
+    eq_(unicode(Sample(title=Html())), u'<test title="<hr class=&quot;rule&quot; />"></test>')
+
+def test_render_profile_should_count_tags_and_sizes():
+    profile = RenderProfile()
+    tag = h.ul(h.li('a'), h.li('<b>'), h.br())
+    eq_(tag.render(profile=profile), tag.render())
+    eq_(profile.nodes, 6)
+    eq_(profile.tags['li'].count, 2)
+    eq_(profile.tags['li'].size, len(u'<li>a</li><li>&lt;b&gt;</li>'))
+    eq_(profile.tags['ul'].size, len(tag.render()))
+    eq_(profile.tags['br'].count, 1)
+
+def test_render_profile_should_time_placeholders_and_phases():
+    profile = RenderProfile()
+    html = CountingLayout(name='x').render(profile=profile)
+    eq_(html, CountingLayout(name='x').render())
+    eq_(sorted(profile.placeholders), ['body', 'content', 'head', 'script'])
+    eq_(profile.placeholders['content'].count, 1)
+    eq_(sorted(profile.phases), ['serialize', 'template'])
+    eq_(profile.phases['serialize'].size, len(html))
+    eq_(profile.as_dict()['tags']['div']['count'], 1)
+
+class SlowDashboard(BaseLayout):
+    def __init__(self, *args, **kwargs):
+        super(SlowDashboard, self).__init__(*args, **kwargs)
+        self.lock = threading.Lock()
+        self.running = self.most_running = 0
+
+    def template(self):
+        return h.html5(h.body(placeholder('first'), placeholder('second'), placeholder('third')))
+
+    def wait(self):
+        """Wait like a backend call, counting the placeholders evaluated at the same time."""
+        with self.lock:
+            self.running += 1
+            self.most_running = max(self.most_running, self.running)
+        time.sleep(0.1)
+        with self.lock:
+            self.running -= 1
+
+    @placeholder
+    def first(self):
+        self.wait()
+        return h.div('first', placeholder('nested'))
+
+    @placeholder
+    def second(self):
+        self.wait()
+        return h.div('second')
+
+    @placeholder
+    def third(self):
+        self.wait()
+        return u'<third>'
+
+    @placeholder
+    def nested(self):
+        self.wait()
+        return h.span('nested')
+
+def test_render_concurrent_should_evaluate_placeholders_concurrently():
+    dashboard = SlowDashboard()
+    html = dashboard.render_concurrent()
+    eq_(html, u'<!DOCTYPE HTML><html><body><div>first<span>nested</span></div>'
+              u'<div>second</div>&lt;third&gt;</body></html>')
+    ok_(dashboard.most_running > 1, dashboard.most_running)
+    serial = SlowDashboard()
+    serial.render()
+    eq_(serial.most_running, 1)
+
+def test_render_concurrent_should_bound_the_number_of_threads():
+    threads = []
+    pool_class, max_threads = multiprocessing.pool.ThreadPool, templates.MAX_THREADS
+    multiprocessing.pool.ThreadPool = lambda processes: threads.append(processes) or pool_class(processes)
+    templates.MAX_THREADS = 2
+    try:
+        dashboard = SlowDashboard()
+        eq_(dashboard.render_concurrent(), SlowDashboard().render())
+    finally:
+        multiprocessing.pool.ThreadPool, templates.MAX_THREADS = pool_class, max_threads
+    eq_(threads, [2])
+    ok_(dashboard.most_running <= 2, dashboard.most_running)
+
+def test_render_concurrent_should_accept_a_pool_and_compiled_templates():
+    class CompiledDashboard(SlowDashboard):
+        compiled = True
+    pool = ThreadPool(4)
+    try:
+        eq_(u''.join(CompiledDashboard().iter_render_concurrent(pool=pool)), SlowDashboard().render())
+    finally:
+        pool.close()
+
+def test_tags_should_be_picklable():
+    tag = h.div(h.td('x', class_='a'), h.customtag(Markup(u'<b>')), h.img(src='x.png'), data_id=1)
+    for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+        restored = pickle.loads(pickle.dumps(tag, protocol))
+        eq_(restored.render(), tag.render())
+        ok_(type(restored.children[1]) is h.customtag)
+
+def test_frozen_tags_should_stay_frozen_when_unpickled():
+    restored = pickle.loads(pickle.dumps(h.nav(h.a('home')).freeze(), pickle.HIGHEST_PROTOCOL))
+    ok_(restored.frozen)
+    eq_(restored.render(), u'<nav><a href="javascript:void(0)">home</a></nav>')
+
+def test_render_parallel_should_match_serial_render():
+    tag = h.html5(h.body(h.table(h.thead(h.tr(h.th('n'))), h.tbody()(
+        [h.tr(h.td(i), h.td(u'<%d>' % i, class_='odd' if i % 2 else None)) for i in range(1000)]
+    ))))
+    eq_(render_parallel(tag, processes=2, threshold=100), tag.render())
+    eq_(parallel._large, [])
+
+def test_render_parallel_should_render_iterator_children_serially():
+    tag = h.div(h.ul()([h.li(i) for i in range(300)] + [iter([h.li('last')])]),
+                h.ol()([h.li(i) for i in range(300)]))
+    eq_(render_parallel(tag, processes=2, threshold=100),
+        u'<div><ul>%s<li>last</li></ul><ol>%s</ol></div>' % ((u''.join(u'<li>%d</li>' % i for i in range(300)),) * 2))
+
+def test_render_parallel_should_render_small_tags_serially():
+    tag = h.ul(h.li('a'), h.li('b'))
+    eq_(render_parallel(tag, threshold=100), tag.render())
+
+def test_table_from_rows_should_match_tags():
+    rows = [(1, u'<one>', 1.5), (2, u'two', None)]
+    expected = h.table(h.thead(h.tr(h.th('n'), h.th('name'), h.th('score'))), h.tbody(
+        h.tr(h.td(1), h.td(u'<one>'), h.td(1.5)), h.tr(h.td(2), h.td(u'two'), h.td()),
+    ), class_='report')
+    eq_(h.table.from_rows(rows, columns=['n', 'name', 'score'], class_='report').render(), expected.render())
+
+def test_table_from_rows_should_accept_dicts_and_columns():
+    expected = u'<table><tbody><tr><td>1</td><td>a</td></tr><tr><td>2</td><td>b</td></tr></tbody></table>'
+    rows = [{'x': 1, 'y': 'a'}, {'x': 2, 'y': 'b'}]
+    eq_(h.table.from_rows(rows, columns=['x', 'y'], header=False).render(), expected)
+    table = h.table.from_rows({'x': [1, 2], 'y': ['a', 'b']}, header=False)
+    eq_(table.render(), expected)
+    eq_(table.render(), expected)
+
+def test_table_from_rows_should_apply_formatters():
+    table = h.table.from_rows([(1, 2.5)], formatters={1: lambda value: Markup(u'<b>%.2f</b>' % value)})
+    eq_(table.render(), u'<table><tbody><tr><td>1</td><td><b>2.50</b></td></tr></tbody></table>')
+
+def test_table_from_rows_should_accept_2d_arrays():
+    class Row(list):
+        def tolist(self):
+            return list(self)
+    class Array(list):
+        ndim = 2
+    table = h.table.from_rows(Array([Row([1, 2]), Row([3, 4])]), header=False)
+    eq_(table.render(), u'<table><tbody><tr><td>1</td><td>2</td></tr><tr><td>3</td><td>4</td></tr></tbody></table>')
+    eq_(table.render(), u'<table><tbody><tr><td>1</td><td>2</td></tr><tr><td>3</td><td>4</td></tr></tbody></table>')
+
+def test_table_from_rows_should_stream_rows_lazily():
+    consumed = []
+    def rows():
+        for i in xrange(10000):
+            consumed.append(i)
+            yield (i, u'row')
+    chunks = h.table.from_rows(rows(), columns=['n', 'text']).iter_render()
+    first = next(chunks)
+    ok_(first.startswith(u'<table><thead><tr><th>n</th><th>text</th></tr></thead><tbody><tr><td>0</td>'))
+    ok_(len(consumed) < 10000)
+    ok_(u''.join(chunks).endswith(u'<tr><td>9999</td><td>row</td></tr></tbody></table>'))
+
+def test_render_to_should_write_encoded_bytes():
+    tag = h.ul()([h.li(u'caf\xe9 %d' % i) for i in range(2000)])
+    fp = io.BytesIO()
+    eq_(tag.render_to(fp, buffer_size=1024), len(fp.getvalue()))
+    eq_(fp.getvalue(), tag.render().encode('utf-8'))
+
+def test_render_to_should_give_writers_data_they_can_keep():
+    class ListWriter(object):
+        def __init__(self):
+            self.written = []
+
+        def write(self, data):
+            self.written.append(data)
+    tag = h.ul()([h.li(i) for i in range(3000)])
+    fp = ListWriter()
+    tag.render_to(fp, buffer_size=1024)
+    ok_(len(fp.written) > 1)
+    eq_(b''.join(fp.written), tag.render().encode('utf-8'))
+
+def test_render_to_should_write_all_the_data_into_raw_streams():
+    class ShortWriter(io.RawIOBase):
+        def __init__(self):
+            self.written = []
+
+        def writable(self):
+            return True
+
+        def write(self, data):
+            self.written.append(bytes(data[:100]))
+            return min(len(data), 100)
+    tag = h.ul()([h.li(i) for i in range(1000)])
+    fp = ShortWriter()
+    eq_(tag.render_to(fp), len(b''.join(fp.written)))
+    eq_(b''.join(fp.written), tag.render().encode('utf-8'))
+
+def test_render_to_should_send_into_sockets():
+    tag = h.ul()([h.li(i) for i in range(1000)])
+    sender, receiver = socket.socketpair()
+    try:
+        size = tag.render_to(sender)
+        sender.close()
+        received = b''.join(iter(lambda: receiver.recv(65536), b''))
+    finally:
+        receiver.close()
+    eq_(received, tag.render().encode('utf-8'))
+    eq_(size, len(received))
+
+def test_render_to_should_accept_write_callables_and_replace_unencodable_characters():
+    class CafeLayout(BaseLayout):
+        title = u'caf\xe9'
+    written = []
+    CafeLayout().render_to(written.append, encoding='ascii')
+    ok_(all(type(data) is bytes for data in written))
+    ok_(b'<title>caf&#233;</title>' in b''.join(written))
+
+SHARED_GREETING = h.p('Hello ', placeholder('name'))
+
+class SharedTreeLayout(BaseLayout):
+    compiled = True
+
+    def template(self):
+        return h.html5(h.body(placeholder('greeting')))
+
+    @placeholder
+    def greeting(self):
+        return SHARED_GREETING
+
+    @placeholder
+    def name(self):
+        return self.c('name')
+
+def test_render_should_not_modify_shared_placeholder_values():
+    eq_(SharedTreeLayout(name='ann').render(), u'<!DOCTYPE HTML><html><body><p>Hello ann</p></body></html>')
+    eq_(SharedTreeLayout(name='bob').render(), u'<!DOCTYPE HTML><html><body><p>Hello bob</p></body></html>')
+    ok_(isinstance(SHARED_GREETING.children[1], Placeholder))
+
+def test_template_should_render_concurrently_in_threads():
+    pool = ThreadPool(8)
+    try:
+        names = ['user%d' % i for i in range(200)]
+        results = pool.map(lambda name: SharedTreeLayout(name=name).render(), names)
+    finally:
+        pool.close()
+    for name, html in zip(names, results):
+        eq_(html, u'<!DOCTYPE HTML><html><body><p>Hello %s</p></body></html>' % name)
+
+def test_factory_should_create_tag_classes_lazily_and_cache_them():
+    factory = type(h)()
+    ok_('div' not in vars(factory))
+    div = factory.div
+    ok_(vars(factory)['div'] is div)
+    eq_(unicode(div()), u'<div></div>')
+    ok_(factory.DIV is div)
+    ok_(factory.customtag is factory.customtag)
+    ok_('customtag' in vars(factory))
+
+def test_factory_should_create_tags_named_after_other_globals():
+    eq_(unicode(h.node()), u'<node></node>')
+
+def tracked_page():
+    page = h.div(id='page')(h.ul(id='menu')([h.li(name) for name in ('home', 'blog')]),
+                            h.p(u'first'), h.p(u'second'))
+    return page, Tracker(page)
+
+def test_tracker_should_render_again_only_changed_tags():
+    page, tracker = tracked_page()
+    eq_(tracker.render(), unicode(page))
+    menu, first, second = page.children
+    cached = menu._html
+    first.children[0] = u'<changed>'
+    second.classes = 'last'
+    eq_(tracker.render(), u'<div id="page"><ul id="menu"><li>home</li><li>blog</li></ul>'
+                          u'<p>&lt;changed&gt;</p><p class="last">second</p></div>')
+    ok_(menu._html is cached)
+    tracker.untrack()
+    ok_(page._html is None and menu._html is None)
+    eq_(type(page.children), list)
+
+def test_tracker_should_give_outermost_changed_fragments_by_id_or_path():
+    page, tracker = tracked_page()
+    eq_(tracker.changes(), {})
+    tracker.render()
+    menu, first, second = page.children
+    menu.children[0].children.append(u'!')
+    menu.append(h.li(u'about'))
+    first.attributes['title'] = u'x'
+    eq_(tracker.changes(), {'menu': u'<ul id="menu"><li>home!</li><li>blog</li><li>about</li></ul>',
+                            (1,): u'<p title="x">first</p>'})
+    menu.children[2].children.append(u'?')
+    eq_(tracker.changes().items(), [((0, 2), u'<li>about?</li>')])
+    tracker.render()
+    page.attributes['id'] = 'page'
+    eq_(tracker.changes(), {})
+
+def test_tracker_should_render_again_every_place_of_a_shared_tag():
+    icon = h.i()
+    page = h.div(h.p(icon), h.span(icon))
+    tracker = Tracker(page)
+    tracker.render()
+    icon.append(u'x')
+    eq_(tracker.render(), u'<div><p><i>x</i></p><span><i>x</i></span></div>')
+    eq_(page.render(), u'<div><p><i>x</i></p><span><i>x</i></span></div>')
+    eq_(tracker.changes(), {(0, 0): u'<i>x</i>', (1, 0): u'<i>x</i>'})
+    page.children[0].children.pop()
+    icon.append(u'y')
+    eq_(tracker.render(), u'<div><p></p><span><i>xy</i></span></div>')
+
+def test_tracker_changes_should_not_render_the_whole_tree():
+    page, tracker = tracked_page()
+    tracker.render()
+    menu, first, second = page.children
+    first.append(u'!')
+    eq_(tracker.changes(), {(1,): u'<p>first!</p>'})
+    ok_(page._html is None and menu._html is not None)
+    eq_(tracker.render(), unicode(page))
+
+def test_tracker_changes_should_not_give_attributes_to_tags():
+    page, tracker = tracked_page()
+    tracker.render()
+    page.children[1].append(u'!')
+    eq_(tracker.changes().keys(), [(1,)])
+    ok_(page.children[1]._attributes is None)
+
+def test_tracker_should_cache_only_small_tags():
+    table = h.table(h.tbody()([h.tr(h.td(i), h.td(u'<%d>' % i)) for i in range(100)]))
+    tracker = Tracker(table, cache_size=200)
+    eq_(tracker.render(), unicode(table))
+    tbody = table.children[0]
+    ok_(table._html is None and tbody._html is None)
+    ok_(all(row._html is not None for row in tbody.children))
+    tbody.children[5].children[0].append(u'!')
+    eq_(tracker.changes(), {(0, 5, 0): u'<td>5!</td>'})
+    eq_(tracker.render(), unicode(table))
+    ok_(u'<td>5!</td>' in tracker.render())
+
+def test_tracker_should_leave_out_removed_tags():
+    page, tracker = tracked_page()
+    tracker.render()
+    removed = page.children.pop()
+    removed.append(u'!')
+    eq_(tracker.changes().keys(), ['page'])
+    eq_(unicode(page), tracker.render())
+
+def test_tracked_tags_should_be_picklable_untracked():
+    page, tracker = tracked_page()
+    tracker.render()
+    copy = pickle.loads(pickle.dumps(page, pickle.HIGHEST_PROTOCOL))
+    copy.children[1].append(u'!')
+    eq_(type(copy.children), list)
+    eq_(unicode(copy.children[1]), u'<p>first!</p>')
+
+@raises(TagFrozenError)
+def test_tags_frozen_while_tracked_should_stay_frozen_untracked():
+    page, tracker = tracked_page()
+    menu = page.children[0]
+    menu.freeze()
+    tracker.untrack()
+    ok_(menu._tracker is None and menu.children[0]._tracker is None)
+    eq_(type(menu.children), tuple)
+    eq_(unicode(menu), u'<ul id="menu"><li>home</li><li>blog</li></ul>')
+    menu.attributes['x'] = 1
+
+def write_fragment(content):
+    fd, path = tempfile.mkstemp(suffix='.html')
+    with os.fdopen(fd, 'wb') as fp:
+        fp.write(content)
+    return path
+
+def test_file_fragment_should_be_inserted_without_escaping():
+    path, empty = write_fragment(u'<svg>café</svg>'.encode('utf-8')), write_fragment(b'')
+    try:
+        tag = h.div(FileFragment(path), u'<')
+        eq_(unicode(tag), u'<div><svg>café</svg>&lt;</div>')
+        eq_(u''.join(tag.iter_render()), unicode(tag))
+        eq_(unicode(h.div(FileFragment(empty))), u'<div></div>')
+    finally:
+        os.remove(path)
+        os.remove(empty)
+
+def test_file_fragment_should_be_read_again_when_modified():
+    path = write_fragment(b'<b>old</b>')
+    try:
+        fragment = FileFragment(path)
+        ok_(fragment.__html__() is FileFragment(path).__html__())
+        with open(path, 'wb') as fp:
+            fp.write(b'<i>new content</i>')
+        os.utime(path, (time.time() + 10, time.time() + 10))
+        eq_(unicode(fragment), u'<i>new content</i>')
+    finally:
+        os.remove(path)
+
+def test_file_fragments_should_keep_the_most_recently_used_files():
+    paths = [write_fragment(b'<p>%d</p>' % i) for i in range(4)]
+    max_files, fragments.MAX_FILES = fragments.MAX_FILES, 2
+    try:
+        fragments._files.clear()
+        for path in paths:
+            FileFragment(path).__html__()
+        eq_(fragments._files.keys(), [os.path.abspath(path) for path in paths[2:]])
+        FileFragment(paths[2]).__html__()
+        eq_(fragments._files.keys(), [os.path.abspath(path) for path in (paths[3], paths[2])])
+        eq_(unicode(FileFragment(paths[0])), u'<p>0</p>')
+    finally:
+        fragments.MAX_FILES = max_files
+        for path in paths:
+            os.remove(path)
+
+def test_file_fragments_should_render_concurrently_in_threads():
+    paths = [write_fragment(b'<p>%d</p>' % i) for i in range(3)]
+    max_files, fragments.MAX_FILES = fragments.MAX_FILES, 2
+    pool = ThreadPool(8)
+    try:
+        tags = [h.div(FileFragment(path)) for path in paths] * 200
+        eq_(pool.map(unicode, tags), [u'<div><p>%d</p></div>' % i for i in range(3)] * 200)
+    finally:
+        pool.close()
+        fragments.MAX_FILES = max_files
+        for path in paths:
+            os.remove(path)
+
+def test_file_fragment_should_be_written_directly_in_the_same_encoding():
+    path = write_fragment(u'<p>café</p>'.encode('latin-1'))
+    try:
+        fragment = FileFragment(path, encoding='latin-1')
+        tag = h.div(u'é', fragment)
+        for encoding in ('utf-8', 'latin-1'):
+            fp = io.BytesIO()
+            eq_(tag.render_to(fp, encoding=encoding), len(fp.getvalue()))
+            eq_(fp.getvalue(), unicode(tag).encode(encoding))
+    finally:
+        os.remove(path)
+
+def test_iterator_children_should_be_consumed_while_rendering():
+    pulled = []
+    def rows():
+        for i in xrange(2000):
+            pulled.append(i)
+            yield h.li(i)
+    tag = h.ul(children=rows())
+    eq_(pulled, [])
+    chunks = tag.iter_render()
+    first = next(chunks)
+    ok_(first.startswith(u'<ul><li>0</li>'))
+    ok_(0 < len(pulled) < 2000)
+    eq_((first + u''.join(chunks)).count(u'<li>'), 2000)
+
+def test_iterator_children_should_render_in_place():
+    eq_(unicode(h.p(iter([]), u'a', iter([]), u'b', (x for x in u'cd'), iter([]), children_delimiter=u',')),
+        u'<p>a,b,c,d</p>')
+    eq_(unicode(h.div(u'<')((h.b(i) for i in xrange(2)), iter([iter([u'&'])]))),
+        u'<div>&lt;<b>0</b><b>1</b>&amp;</div>')
+    eq_(unicode(h.script(iter([u'a < b']))), u'<script type="text/javascript">a < b</script>')
+
+def test_iterable_children_should_render_on_every_render():
+    for children in (xrange(3), set([u'a']), {u'k': 1}.viewkeys()):
+        tag = h.ul(children=children)
+        eq_(unicode(tag), unicode(tag))
+        ok_(len(unicode(tag)) > len(u'<ul></ul>'))
+
+def test_fast_constructor_should_render_like_the_factory():
+    class Row(Tag):
+        default_classes = ['row']
+    eq_(unicode(h.li._fast(u'<x>', {'class': 'a b', 'data-id': 1})), unicode(h.li(u'<x>', class_='a b', data_id=1)))
+    eq_(unicode(Row._fast([h.td._fast(u'1')], {'class': ['odd']})), unicode(Row(h.td(u'1'), class_=['odd'])))
+    eq_(unicode(h.link._fast(attributes={'href': 'a.css'})), unicode(h.link(href='a.css')))
+    eq_(h.input._fast(attributes={'name': 'q'}).name, 'q')
+    eq_(unicode(h.script._fast(u'a < b')), unicode(h.script(u'a < b')))
+
+@raises(KeyError)
+def test_fast_constructor_should_check_required_attributes():
+    h.link._fast()
+
+@raises(TagSingletonError)
+def test_fast_constructor_should_not_give_children_to_singletons():
+    h.br._fast([u'text'])
+
+class CliPage(BaseLayout):
+    @placeholder
+    def body(self):
+        return h.p(self.c('text'))
+
+def test_cli_should_render_contexts_into_files():
+    directory = tempfile.mkdtemp()
+    contexts = os.path.join(directory, 'contexts.jsonl')
+    with open(contexts, 'w') as fp:
+        fp.write('{"slug": "a", "text": "<first>"}\n\n{"slug": "b/c", "text": "caf\\u00e9"}\n')
+    stderr, sys.stderr = sys.stderr, io.BytesIO()
+    try:
+        eq_(cli.main(['html_node.tests:CliPage', contexts, '-o', directory, '-p', '{slug}.html', '-j', '2',
+                      '--chunk-size', '1']), 0)
+        ok_(sys.stderr.getvalue().startswith('2 pages, '))
+        with open(os.path.join(directory, 'b', 'c.html'), 'rb') as fp:
+            eq_(fp.read().decode('utf-8'), CliPage(text=u'café').render())
+        with open(os.path.join(directory, 'a.html'), 'rb') as fp:
+            eq_(fp.read().decode('utf-8'), CliPage(text=u'<first>').render())
+    finally:
+        sys.stderr = stderr
+        shutil.rmtree(directory)
+
+def test_cli_should_report_throughput_and_latency_percentiles():
+    stream = io.BytesIO()
+    cli.report([('a.html', 1000, 0.001 * i) for i in range(1, 101)], 2.0, stream)
+    eq_(stream.getvalue(), '100 pages, 100,000 bytes in 2.00 s: 50.0 pages/s, 0.1 MB/s\n'
+                           'latency: p50 50.00 ms, p90 90.00 ms, p99 99.00 ms, max 100.00 ms\n')
+
+def indexed_page():
+    page = h.body(h.nav(id='nav')(h.ul()([h.li(h.a(name, href='/' + name), class_='item ' + name)
+                                          for name in ('home', 'blog', 'about')])),
+                  h.form(h.input(name='q'), id='search'), h.div(h.form(action='/login'), class_='item'))
+    return page, Index(page)
+
+def test_index_should_find_tags_by_id_tagname_and_class():
+    page, index = indexed_page()
+    eq_(index.find_by_id('search').tagname, 'form')
+    eq_(index.find_by_id('missing'), None)
+    eq_([tag.attributes.get('id') for tag in index.find_all(tag='form')], ['search', None])
+    eq_(len(index.find_all(tag=h.li)), 3)
+    eq_([unicode(tag.children[0].children[0]) for tag in index.find_all(tag='li', class_='item')],
+        [u'home', u'blog', u'about'])
+    eq_(index.find_all(class_='item blog'), [page.children[0].children[0].children[1]])
+    eq_(index.find_all(tag='li', class_=['item', 'missing']), [])
+    eq_(len(index.find_all()), 13)
+
+def test_index_should_be_kept_up_to_date_by_mutations():
+    page, index = indexed_page()
+    for form in index.find_all(tag='form'):
+        form.prepend(h.input(type='hidden', name='csrf', value='token'))
+    eq_(len(index.find_all(tag='input')), 3)
+    menu = index.find_all(tag='ul')[0]
+    menu(h.li(u'new', id='new', class_='item'))
+    menu.children.pop(0)
+    eq_([tag.attributes.get('id') for tag in index.find_all(tag='li', class_='item')], [None, None, 'new'])
+    index.find_by_id('new').classes = 'active'
+    index.find_by_id('search').attributes['id'] = 'find'
+    eq_(index.find_all(class_='active'), [index.find_by_id('new')])
+    eq_(index.find_by_id('search'), None)
+    eq_(index.find_by_id('find').tagname, 'form')
+    page.children = page.children[:1]
+    index.touch(page)
+    eq_(index.find_all(tag='form'), [])
+    index.untrack()
+    eq_(index.find_all(), [])
+
+def test_index_should_be_kept_up_to_date_by_fill():
+    page = h.div(Placeholder('content'))
+    index = Index(page)
+    fill(page, {'content': h.p(id='filled')})
+    eq_(index.find_by_id('filled'), page.children[0])
+
+@raises(TagTrackedError)
+def test_tracker_should_not_take_over_tags_tracked_by_an_index():
+    page, index = indexed_page()
+    try:
+        Tracker(h.div(page))
+    finally:
+        page.append(h.span(id='y'))
+        eq_(index.find_by_id('y'), page.children[-1])
+
+@raises(TagTrackedError)
+def test_tracked_tree_should_not_receive_tags_tracked_by_another_tracker():
+    page, index = indexed_page()
+    other = h.div(h.p())
+    Tracker(other)
+    children, html = list(page.children), index.render()
+    try:
+        page.append(h.section(other.children[0]))
+    finally:
+        eq_(page.children, children)
+        eq_(index.render(), html)
+        eq_(page.render(), html)
+
+def test_index_should_keep_the_order_of_changed_tags():
+    page, index = indexed_page()
+    home = index.find_all(tag='li')[0]
+    home.attributes['id'] = 'home'
+    home.classes = 'item home first'
+    eq_(index.find_all(tag='li')[0], home)
+    eq_(index.find_all(class_='item')[0], home)
+    eq_(index.find_all(class_='first'), [home])
@@ -0,0 +1,467 @@
+# -*- coding: utf-8 -*-
+from collections import OrderedDict, defaultdict
+from .tags import Tag, _serialize
+
+
+__all__ = ['TagTrackedError', 'Tracker', 'Index']
+
+# Maximum length of the HTML cached by a tracked tag, larger tags are serialized again
+# from the cache of their children, so that the tree is not cached at every level
+CACHE_SIZE = 16 * 1024
+
+
+class TagTrackedError(Exception):
+    """Raised when a tag tracked by a tracker is put in the tree of another one."""
+    pass
+
+
+def _changing(method):
+    """Wrap a method of a container so that it reports a change of the tag owning it."""
+    def changing(self, *args, **kwargs):
+        result = method(self, *args, **kwargs)
+        self._changed()
+        return result
+    changing.__name__ = method.__name__
+    return changing
+
+
+class _TrackedList(list):
+    """Children of a tracked tag, which report their changes and the added and removed nodes."""
+    __slots__ = ('tag',)
+
+    def __init__(self, items, tag):
+        super(_TrackedList, self).__init__(items)
+        self.tag = tag
+
+    def _check(self, items):
+        tracker = self.tag._tracker
+        if tracker is not None:
+            tracker._check(items)
+
+    def _changed(self, added=(), removed=()):
+        tracker = self.tag._tracker
+        if tracker is not None:
+            tracker._changed(self.tag, added, removed)
+
+    def append(self, item):
+        self._check((item,))
+        list.append(self, item)
+        self._changed((item,))
+
+    def insert(self, index, item):
+        self._check((item,))
+        list.insert(self, index, item)
+        self._changed((item,))
+
+    def extend(self, items):
+        items = list(items)
+        self._check(items)
+        list.extend(self, items)
+        self._changed(items)
+
+    def __iadd__(self, items):
+        self.extend(items)
+        return self
+
+    def __setitem__(self, index, item):
+        if isinstance(index, slice):
+            removed, item = self[index], list(item)
+        else:
+            removed = (self[index],)
+        self._check(item if isinstance(index, slice) else (item,))
+        list.__setitem__(self, index, item)
+        self._changed(item if isinstance(index, slice) else (item,), removed)
+
+    def __setslice__(self, i, j, items):
+        removed, items = self[i:j], list(items)
+        self._check(items)
+        list.__setslice__(self, i, j, items)
+        self._changed(items, removed)
+
+    def __delitem__(self, index):
+        removed = self[index] if isinstance(index, slice) else (self[index],)
+        list.__delitem__(self, index)
+        self._changed(removed=removed)
+
+    def __delslice__(self, i, j):
+        removed = self[i:j]
+        list.__delslice__(self, i, j)
+        self._changed(removed=removed)
+
+    def __imul__(self, n):
+        removed = list(self) if n <= 0 else ()
+        list.__imul__(self, n)
+        self._changed(removed=removed)
+        return self
+
+    def pop(self, *args):
+        item = list.pop(self, *args)
+        self._changed(removed=(item,))
+        return item
+
+    def remove(self, item):
+        del self[self.index(item)]
+
+    reverse = _changing(list.reverse)
+    sort = _changing(list.sort)
+
+    def __reduce__(self):
+        return list, (list(self),)
+
+
+class _TrackedDict(dict):
+    """Attributes of a tracked tag, which report their changes."""
+    __slots__ = ('tag',)
+
+    def __init__(self, items, tag):
+        super(_TrackedDict, self).__init__(items)
+        self.tag = tag
+
+    def _changed(self):
+        tracker = self.tag._tracker
+        if tracker is not None:
+            tracker._changed(self.tag)
+
+    __setitem__ = _changing(dict.__setitem__)
+    __delitem__ = _changing(dict.__delitem__)
+    clear = _changing(dict.clear)
+    pop = _changing(dict.pop)
+    popitem = _changing(dict.popitem)
+    setdefault = _changing(dict.setdefault)
+    update = _changing(dict.update)
+
+    def __reduce__(self):
+        return dict, (dict(self),)
+
+
+class Tracker(object):
+    """Track the changes of a tree of tags to render it again incrementally.
+
+    Tags of the tree containing other tags cache their rendered HTML if it is at most
+    ``cache_size`` characters long, and the cache is discarded only for a changed tag
+    and its ancestors, so rendering the tree again costs in proportion to the change
+    and to the few large tags containing it, rather than to the whole tree. Tags without
+    tags inside are rendered again with their parent, as it costs about as much as
+    splicing cached HTML. Tags added to the
+    tree are tracked too, including tags which appear at several places in it, and tags
+    removed from it are no longer tracked.
+
+    Changes are noticed through the methods and properties of the tags, and of their
+    ``children`` and ``attributes``. Call :meth:`touch` after changing a tag otherwise,
+    e.g. assigning its ``children``. Nodes other than tags are assumed not to change.
+    A tag can be tracked by a single tracker, so :class:`TagTrackedError` is raised
+    when a tag tracked by another one is in the tree or added to it.
+    """
+    def __init__(self, root, cache_size=CACHE_SIZE):
+        """
+        :param root: The tag at the root of the tree
+        :param cache_size: Maximum length of the HTML cached by a tag
+        """
+        self.root = root
+        self.cache_size = cache_size
+        # Tracked tags and the list of their parents, once per occurrence, by id
+        self.__parents = {}
+        # Ids of the tags whose HTML is too large to be cached
+        self.__large = set()
+        self.__changed = OrderedDict()
+        try:
+            self.__adopt(None, (root,))
+        except TagTrackedError:
+            self.untrack()
+            raise
+
+    def __adopt(self, parent, nodes):
+        """Track the tags among ``nodes`` and their descendents as children of ``parent``."""
+        stack = [(parent, node) for node in reversed(nodes)]
+        while stack:
+            parent, tag = stack.pop()
+            if not isinstance(tag, Tag) or tag.frozen:
+                continue
+            entry = self.__parents.get(id(tag))
+            if entry is not None:
+                entry[1].append(parent)
+                continue
+            if tag._tracker is not None:
+                raise TagTrackedError
+            self.__parents[id(tag)] = (tag, [parent])
+            tag._tracker = self
+            tag._html = None
+            if not isinstance(tag.children, _TrackedList):
+                tag.children = _TrackedList(tag.children, tag)
+            self._track_attributes(tag)
+            self._added(tag)
+            stack.extend((tag, child) for child in reversed(tag.children))
+
+    def _check(self, nodes):
+        """Raise TagTrackedError if a tag among ``nodes`` or their descendents is tracked
+        by another tracker, before they are added to the tree."""
+        stack = list(nodes)
+        while stack:
+            tag = stack.pop()
+            if not isinstance(tag, Tag) or tag.frozen or tag._tracker is self:
+                continue
+            if tag._tracker is not None:
+                raise TagTrackedError
+            stack.extend(tag.children)
+
+    def __release(self, parent, nodes):
+        """Remove an occurrence of ``parent`` from the parents of the tags among ``nodes``,
+        and stop tracking those left without parent, and their descendents."""
+        stack = [(parent, node) for node in nodes]
+        while stack:
+            parent, tag = stack.pop()
+            entry = self.__parents.get(id(tag)) if isinstance(tag, Tag) else None
+            if entry is None or entry[0] is not tag:
+                continue
+            parents = entry[1]
+            for index, other in enumerate(parents):
+                if other is parent:
+                    del parents[index]
+                    break
+            if parents:
+                continue
+            del self.__parents[id(tag)]
+            self.__large.discard(id(tag))
+            self._removed(tag)
+            tag._tracker = None
+            # Tags frozen while tracked keep their frozen children, attributes and HTML
+            if not tag.frozen:
+                tag._html = None
+                tag.children = list(tag.children)
+                if tag._attributes is not None:
+                    tag._attributes = dict(tag._attributes)
+            stack.extend((tag, child) for child in tag.children)
+
+    def _track_attributes(self, tag):
+        """Report the changes of the attributes of a tag, if it has attributes of its own.
+        Tags using the default attributes are left so, as they render faster."""
+        if tag._attributes is not None and not isinstance(tag._attributes, _TrackedDict):
+            tag._attributes = _TrackedDict(tag._attributes, tag)
+
+    def _added(self, tag):
+        """Called when a tag starts being tracked."""
+
+    def _removed(self, tag):
+        """Called when a tag stops being tracked."""
+
+    def _updated(self, tag):
+        """Called when a tracked tag is changed."""
+
+    def _changed(self, tag, added=(), removed=()):
+        """Discard the cached HTML of a changed tag and of all its ancestors, tracking
+        ``added`` nodes and no longer tracking ``removed`` ones."""
+        self._track_attributes(tag)
+        if added:
+            self.__adopt(tag, added)
+        if removed:
+            self.__release(tag, removed)
+        self._updated(tag)
+        if id(tag) not in self.__changed:
+            self.__changed[id(tag)] = (tag, tag._html)
+        self.__large.discard(id(tag))
+        tag._html = None
+        # Ancestors of a tag without cached HTML have none either
+        stack = [tag]
+        while stack:
+            for parent in self.__parents.get(id(stack.pop()), (None, ()))[1]:
+                if parent is not None and parent._html is not None:
+                    parent._html = None
+                    stack.append(parent)
+
+    def touch(self, tag):
+        """Tell that a tag of the tree was changed other than through its methods.
+
+        The former children of the tag are found among all the tracked tags, so it costs
+        in proportion to the size of the tree.
+        """
+        if not isinstance(tag.children, _TrackedList):
+            tag.children = _TrackedList(tag.children, tag)
+        self._check(tag.children)
+        former = [node for node, parents in self.__parents.values() for parent in parents if parent is tag]
+        self._changed(tag, tag.children, former)
+
+    def render(self):
+        """Render the tree, rendering again only the tags which changed or contain a change."""
+        return self.__render(self.root)
+
+    def __render(self, top):
+        """Render a tag of the tree, caching the HTML of its descendents which contain tags
+        and are small enough."""
+        large = self.__large
+        stack = [(top, None)]
+        while stack:
+            tag, tags = stack.pop()
+            if tags is not None:
+                if any(id(child) in large for child in tags) or \
+                        sum(len(child._html) for child in tags if child._html is not None) > self.cache_size:
+                    large.add(id(tag))
+                    continue
+                html = u''.join(_serialize((tag,)))
+                if len(html) > self.cache_size:
+                    large.add(id(tag))
+                else:
+                    tag._html = html
+            elif tag._html is None:
+                tags = [child for child in tag.children if isinstance(child, Tag) and child._tracker is self]
+                if not tags:
+                    continue
+                if id(tag) not in large:
+                    stack.append((tag, tags))
+                stack.extend((child, None) for child in tags if child._html is None and child.children)
+        return top._html if top._html is not None else u''.join(_serialize((top,)))
+
+    def changes(self):
+        """Get the HTML of the tags changed since the last time.
+
+        Only the outermost changed tags which are still in the tree are rendered, so each
+        one can replace the former element in a page, and the rest of the tree is left to
+        be rendered when it is asked for. They are keyed by their ``id`` attribute if any,
+        otherwise by their path from the root as a tuple of indexes in ``children``, once
+        for every place of a tag in the tree. Tags which render the same as before are
+        left out, if their HTML was cached when they were changed.
+        """
+        changed, self.__changed = self.__changed, OrderedDict()
+        depths = {}
+        tags = [tag for tag, html in changed.itervalues() if id(tag) in self.__parents]
+        # Ancestors come first, as they are deeper than none of their descendents
+        tags.sort(key=lambda tag: self.__depth(tag, depths))
+        reported = set()
+        fragments = OrderedDict()
+        for tag in tags:
+            paths = self.__paths(tag, reported)
+            if not paths:
+                continue
+            html = self.__render(tag)
+            if html == changed[id(tag)][1]:
+                continue
+            reported.add(id(tag))
+            # Read the id without giving the tag attributes of its own
+            attributes = tag.default_attributes if tag._attributes is None else tag._attributes
+            for path in paths:
+                fragments[attributes.get('id', path)] = html
+        return fragments
+
+    def __depth(self, tag, depths):
+        """Get the length of the longest path from the root to a tag."""
+        stack = [tag]
+        while stack:
+            node = stack[-1]
+            if id(node) in depths:
+                stack.pop()
+                continue
+            parents = [parent for parent in self.__parents[id(node)][1] if parent is not None]
+            pending = [parent for parent in parents if id(parent) not in depths]
+            if pending:
+                stack.extend(pending)
+            else:
+                depths[id(node)] = 1 + max(depths[id(parent)] for parent in parents) if parents else 0
+                stack.pop()
+        return depths[id(tag)]
+
+    def __paths(self, tag, reported):
+        """Get the paths from the root to a tag which do not go through a tag in ``reported``."""
+        paths = []
+        stack = [(tag, ())]
+        while stack:
+            node, path = stack.pop()
+            if node is self.root:
+                paths.append(path)
+                continue
+            for parent in set(self.__parents[id(node)][1]):
+                if parent is None or id(parent) in reported:
+                    continue
+                for index, child in enumerate(parent.children):
+                    if child is node:
+                        stack.append((parent, (index,) + path))
+        return sorted(paths)
+
+    def untrack(self):
+        """Stop tracking the tree, which is then rendered entirely every time."""
+        self.__release(None, (self.root,))
+        self.__parents.clear()
+        self.__large.clear()
+        self.__changed.clear()
+
+
+class Index(Tracker):
+    """Track a tree of tags, and index its tags by id, class and tagname.
+
+    The index is kept up to date as the tree changes, the same way as a :class:`Tracker`
+    notices changes, so finding tags costs in proportion to the number of tags found
+    rather than to the size of the tree. Tags are found in the order they were added to
+    the index, which is their document order when the tree was indexed, except that
+    tags found by a class they were given afterwards come after the others. Frozen tags
+    are not indexed, as they cannot be modified anyway.
+    """
+    def __init__(self, root, cache_size=CACHE_SIZE):
+        self.__entries = OrderedDict()
+        self.__ids = {}
+        self.__classes = defaultdict(OrderedDict)
+        self.__tagnames = defaultdict(OrderedDict)
+        super(Index, self).__init__(root, cache_size=cache_size)
+
+    @staticmethod
+    def __keys(tag):
+        """Get the id and the classes of a tag, without giving it attributes of its own."""
+        attributes = tag.default_attributes if tag._attributes is None else tag._attributes
+        return attributes.get('id'), tuple(tag.classes.split())
+
+    def _added(self, tag):
+        id_, classes = self.__keys(tag)
+        self.__entries[id(tag)] = (tag, id_, classes)
+        self.__index(tag, id_, classes)
+        self.__tagnames[tag.tagname][id(tag)] = tag
+
+    def _removed(self, tag):
+        tag, id_, classes = self.__entries.pop(id(tag))
+        self.__unindex(tag, id_, classes)
+        self.__discard(self.__tagnames, tag.tagname, tag)
+
+    def _updated(self, tag):
+        entry = self.__entries.get(id(tag))
+        if entry is not None:
+            keys = self.__keys(tag)
+            if entry[1:] != keys:
+                self.__unindex(tag, entry[1], (name for name in entry[2] if name not in keys[1]))
+                self.__index(tag, keys[0], (name for name in keys[1] if name not in entry[2]))
+                self.__entries[id(tag)] = (tag,) + keys
+
+    def __index(self, tag, id_, classes):
+        if id_ is not None:
+            self.__ids[id_] = tag
+        for name in classes:
+            self.__classes[name][id(tag)] = tag
+
+    def __unindex(self, tag, id_, classes):
+        if id_ is not None and self.__ids.get(id_) is tag:
+            del self.__ids[id_]
+        for name in classes:
+            self.__discard(self.__classes, name, tag)
+
+    @staticmethod
+    def __discard(index, key, tag):
+        tags = index[key]
+        tags.pop(id(tag), None)
+        if not tags:
+            del index[key]
+
+    def find_by_id(self, id_):
+        """Find the tag of an id, or None if there is none."""
+        return self.__ids.get(id_)
+
+    def find_all(self, tag=None, class_=None):
+        """Find the tags of a tagname or a Tag class, having all the classes of ``class_``.
+
+        :param tag: A tagname or a Tag class, any by default
+        :param class_: Space-separated classes, or a list of them
+        """
+        indexes = []
+        if tag is not None:
+            indexes.append(self.__tagnames.get(getattr(tag, 'tagname', tag).lower(), {}))
+        if class_ is not None:
+            names = class_.split() if isinstance(class_, basestring) else class_
+            indexes.extend(self.__classes.get(name, {}) for name in names)
+        if not indexes:
+            return [entry[0] for entry in self.__entries.itervalues()]
+        smallest = min(indexes, key=len)
+        return [found for key, found in smallest.iteritems() if all(key in index for index in indexes)]
@@ -1,12 +1,45 @@
 # -*- coding: utf-8 -*-
+import codecs
 import datetime
-from cgi import escape
 
 
 TAG_TYPE_OPEN = 1
 TAG_TYPE_CLOSE = 2
 TAG_TYPE_SINGLETON = 3
 
+# Number of encoded bytes collected before they are written out
+BUFFER_SIZE = 64 * 1024
+
+
+class Markup(unicode):
+    """A string of HTML which is safe already, so it is never escaped again."""
+    __slots__ = ()
+
+    def __html__(self):
+        return self
+
+
+def escape(value, quote=False):
+    """Replace special characters ``&``, ``<`` and ``>`` to HTML-safe sequences, and also
+    the double quote character if ``quote`` is true. :class:`Markup` is left as it is,
+    except for double quotes if ``quote`` is true, as they would end an attribute value.
+
+    Unlike `cgi.escape`, strings without special characters are returned without copying.
+    >>> escape(u'<a href="x">&</a>', quote=True)
+    u'&lt;a href=&quot;x&quot;&gt;&amp;&lt;/a&gt;'
+    """
+    if isinstance(value, Markup):
+        return value.replace('"', '&quot;') if quote and '"' in value else value
+    if '&' in value:
+        value = value.replace('&', '&amp;')
+    if '<' in value:
+        value = value.replace('<', '&lt;')
+    if '>' in value:
+        value = value.replace('>', '&gt;')
+    if quote and '"' in value:
+        value = value.replace('"', '&quot;')
+    return value
+
 
 def render_tag(*args, **kwargs):
     """Wrap one or more strings with tag format, larger-then and smaller-then sign.
@@ -35,24 +68,79 @@ def render_tag(*args, **kwargs):
 
 def html_param(k, v):
     """Provide a very flexible way to create a pair of attribute-vlaue pair or just attribute."""
-    partial = lambda key, value: u'{}="{}"'.format(key, escape(value, quote=True))
     if v is None:
         return k
     elif v is True:
-        return partial(k, k)
+        v = k
     elif isinstance(v, basestring):
-        return partial(k, v)
+        pass
+    elif hasattr(v, '__html__'):
+        v = Markup(v.__html__())
     elif isinstance(v, list):
-        return partial(k, u' '.join(v))
+        v = u' '.join(v)
     elif isinstance(v, dict):
-        return partial(k, u' '.join([key for key, value in v.items() if value]))
+        v = u' '.join([key for key, value in v.iteritems() if value])
     elif isinstance(v, (int, float, long)):
-        return partial(k, unicode(v))
+        v = unicode(v)
     elif isinstance(v, datetime.datetime):
-        return partial(k, v.isoformat())
+        v = v.isoformat()
     else:
         raise ValueError('Unknown value is used in html parameters.')
+    return u'%s="%s"' % (k, escape(v, quote=True))
 
 
 def html_params(attributes):
-    return u' '.join([html_param(k, v) for k, v in attributes.items() if v is not False])
+    return u' '.join([html_param(k, v) for k, v in attributes.iteritems() if v is not False])
+
+
+def _write_all(write, data):
+    """Write all the data with the ``write`` method of a file-like object, which may
+    write only part of it, as raw streams do."""
+    while data:
+        written = write(data)
+        if written is None or written >= len(data):
+            return
+        data = data[written:]
+
+
+def write_encoded(chunks, fp, encoding='utf-8', buffer_size=BUFFER_SIZE):
+    """Encode chunks of HTML and write them through a reusable buffer.
+
+    Characters which cannot be encoded are written as character references. Chunks
+    keeping the bytes they were decoded from as ``encoded``, in their ``encoding``, are
+    written out directly if it is the same, without being encoded again. The buffer is
+    copied into a byte string whenever it is written, so writers may keep what they
+    are given.
+
+    :param fp: A file-like object opened in binary mode, a socket, or a callable such
+        as the WSGI ``write`` callable, which is given byte strings
+    :return: The number of bytes written
+    """
+    if hasattr(fp, 'sendall'):
+        write = fp.sendall
+    elif hasattr(fp, 'write'):
+        write = lambda data: _write_all(fp.write, data)
+    else:
+        write = fp
+    codec = codecs.lookup(encoding).name
+
+    buf = bytearray()
+    total = 0
+    for chunk in chunks:
+        if type(chunk) is not unicode and getattr(chunk, 'encoding', None) == codec:
+            if buf:
+                write(bytes(buf))
+                total += len(buf)
+                del buf[:]
+            write(chunk.encoded if write is not fp else bytes(chunk.encoded))
+            total += len(chunk.encoded)
+            continue
+        buf += chunk.encode(encoding, 'xmlcharrefreplace')
+        if len(buf) >= buffer_size:
+            write(bytes(buf))
+            total += len(buf)
+            del buf[:]
+    if buf:
+        write(bytes(buf))
+        total += len(buf)
+    return total
@@ -3,7 +3,10 @@ from setuptools import setup, find_packages
 setup(
     name="HtmlNode",
     version="0.1.8",
-    packages=find_packages(),
+    packages=find_packages(exclude=["benchmarks"]),
+    entry_points={
+        'console_scripts': ['html-node-render = html_node.cli:main'],
+    },
     description="A simple Python HTML generator",
     author="Hing-Lung Lau",
     author_email="lung220@gmail.com",